@@ -0,0 +1,146 @@
+# imuPIN - capture.py
+# Stuart McDaniel, 2016
+
+import sensor
+
+import numpy
+import serial
+import threading
+import time
+
+# CONSTANTS.
+# Number of samples held in ring buffer (20 seconds at 100 Hz).
+RING_CAPACITY = 2048
+
+
+# Fixed-size ring buffer of accelerometer and gyrometer counts.
+# Lock-free for one producer thread and one consumer thread: each count is only written by one side, and the producer
+# publishes samples by advancing write_count after copying them in.
+class SampleRingBuffer:
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.samples = numpy.zeros((capacity, 6), dtype=numpy.int16)
+		# Time each sample was read (seconds, time.perf_counter).
+		self.times = numpy.zeros(capacity)
+		# Total samples written by producer.
+		self.write_count = 0
+		# Total samples read by consumer.
+		self.read_count = 0
+		# Samples dropped because buffer full.
+		self.overruns = 0
+		# Most samples waiting in buffer at once.
+		self.high_water_mark = 0
+
+	# Number of samples waiting to be read.
+	def __len__(self):
+		return self.write_count - self.read_count
+
+	# Copy batch of samples read at read_time into buffer, dropping samples that do not fit (producer only).
+	def push(self, batch, read_time):
+		free = self.capacity - (self.write_count - self.read_count)
+		if len(batch) > free:
+			self.overruns += len(batch) - free
+			batch = batch[:free]
+
+		# Copy samples in up to two parts around end of buffer.
+		start = self.write_count % self.capacity
+		first = min(len(batch), self.capacity - start)
+		self.samples[start:start + first] = batch[:first]
+		self.samples[:len(batch) - first] = batch[first:]
+		self.times[start:start + first] = read_time
+		self.times[:len(batch) - first] = read_time
+
+		# Publish samples.
+		self.write_count += len(batch)
+		self.high_water_mark = max(self.high_water_mark, self.write_count - self.read_count)
+
+	# Copy up to max_samples waiting samples and their read times out of buffer (consumer only).
+	def pop(self, max_samples=None):
+		size = self.write_count - self.read_count
+		if max_samples is not None:
+			size = min(size, max_samples)
+
+		# Copy samples out in up to two parts around end of buffer.
+		start = self.read_count % self.capacity
+		first = min(size, self.capacity - start)
+		batch = numpy.concatenate((self.samples[start:start + first], self.samples[:size - first]))
+		times = numpy.concatenate((self.times[start:start + first], self.times[:size - first]))
+
+		# Release space.
+		self.read_count += size
+
+		return batch, times
+
+
+# Background capture of sensor samples from serial port into ring buffer.
+class SerialCapture:
+	def __init__(self, ser, capacity=RING_CAPACITY):
+		self.ser = ser
+		self.buffer = SampleRingBuffer(capacity)
+		self.samples_ready = threading.Event()
+		self.running = False
+		self.error = None
+		self.thread = None
+		# Number of reads from serial port.
+		self.reads = 0
+		# Largest batch of samples from one read.
+		self.largest_read = 0
+
+	# Start reader thread.
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+		return self
+
+	# Stop reader thread. Waits for read in progress, so may block for serial port timeout.
+	def stop(self):
+		self.running = False
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+
+	# Read packets from serial port into ring buffer until stopped (reader thread).
+	def run(self):
+		try:
+			while self.running:
+				counts = sensor.get_sensor_counts_batch(self.ser)
+				self.buffer.push(counts, time.perf_counter())
+				self.reads += 1
+				self.largest_read = max(self.largest_read, len(counts))
+				self.samples_ready.set()
+		except serial.SerialException as error:
+			self.error = error
+			self.running = False
+			self.samples_ready.set()
+
+	# Get batch of up to max_samples acceleration and angular velocity values as array of shape (N, 6).
+	# Waits until at least one sample captured.
+	def get_sensor_values_batch(self, metres, radians, max_samples=None):
+		while len(self.buffer) == 0:
+			if self.error is not None:
+				raise self.error
+			if not self.running:
+				raise serial.SerialException("Capture stopped.")
+			# Clear before checking again so set by reader thread is not missed.
+			self.samples_ready.clear()
+			if len(self.buffer) == 0:
+				self.samples_ready.wait()
+
+		counts, times = self.buffer.pop(max_samples)
+
+		return sensor.scale_counts(counts, metres, radians)
+
+	# Get capture counters.
+	def stats(self):
+		return {
+			"captured": self.buffer.write_count,
+			"consumed": self.buffer.read_count,
+			"waiting": len(self.buffer),
+			"overruns": self.buffer.overruns,
+			"high_water_mark": self.buffer.high_water_mark,
+			"capacity": self.buffer.capacity,
+			"reads": self.reads,
+			"largest_read": self.largest_read
+		}
@@ -0,0 +1,29 @@
+# imuPIN - capture_recording.py
+# Stuart McDaniel, 2016
+
+# Records sensor packets to capture file for replay without sensor.
+# Usage: python capture_recording.py <capture file> [number of packets]
+
+import replay
+import sensor
+
+import sys
+
+# Number of packets to record.
+if len(sys.argv) > 2:
+	packets = int(sys.argv[2])
+else:
+	packets = 6000
+
+# Open serial port.
+print("Connecting to sensor...")
+ser = sensor.open_serial_port()
+print("Sensor connected.")
+
+# Record packets to capture file.
+print("Recording packets...")
+replay.record_capture(ser, sys.argv[1], packets)
+print("Packets recorded.")
+
+# Close serial port.
+sensor.close_serial_port(ser)
@@ -0,0 +1,121 @@
+# imuPIN - decoding_benchmark.py
+# Stuart McDaniel, 2016
+
+# Compares packets per second decoded by byte-by-byte and chunked packet readers.
+# Usage: python decoding_benchmark.py [captured byte stream file]
+
+import sensor
+
+import io
+import random
+import sys
+import time
+
+# CONSTANTS.
+# Number of packets in synthesised byte stream.
+PACKETS = 20000
+
+
+# Serial port that reads from byte stream.
+class StreamPort:
+	def __init__(self, stream):
+		self.stream = io.BytesIO(stream)
+		self.size = len(stream)
+
+	@property
+	def in_waiting(self):
+		return self.size - self.stream.tell()
+
+	def read(self, size=1):
+		return self.stream.read(size)
+
+
+# Escape and frame packet body as sent by sensor.
+def encode_packet(body):
+	packet = bytearray([sensor.SLIP_END, sensor.SECOND])
+	for byte in body:
+		if byte == sensor.SLIP_END:
+			packet += bytes([sensor.SLIP_ESC, sensor.SLIP_ESC_END])
+		elif byte == sensor.SLIP_ESC:
+			packet += bytes([sensor.SLIP_ESC, sensor.SLIP_ESC_ESC])
+		else:
+			packet.append(byte)
+	packet.append(sensor.SLIP_END)
+
+	return bytes(packet)
+
+
+# Read packet one byte at a time (previous sensor.get_sensor_values reader).
+def read_packet_bytewise(ser):
+	packet = []
+
+	# Read first two bytes until found SLIP_END and SECOND bytes to indicate start of packet.
+	chars = [ser.read(size=1)[0]]
+	while True:
+		chars.append(ser.read(size=1)[0])
+		if chars[0] == sensor.SLIP_END and chars[1] == sensor.SECOND:
+			packet.append(chars[0])
+			packet.append(chars[1])
+			break
+		else:
+			chars = [chars[1]]
+
+	# Read and append bytes until found SLIP_END byte to indicate end of packet.
+	escaped = False
+	while True:
+		char = ser.read(size=1)[0]
+		if char == sensor.SLIP_END:
+			packet.append(char)
+			break
+		elif char == sensor.SLIP_ESC:
+			escaped = True
+		elif char == sensor.SLIP_ESC_END:
+			if escaped:
+				packet.append(sensor.SLIP_END)
+				escaped = False
+			else:
+				packet.append(char)
+		elif char == sensor.SLIP_ESC_ESC:
+			if escaped:
+				packet.append(sensor.SLIP_ESC)
+				escaped = False
+			else:
+				packet.append(char)
+		else:
+			packet.append(char)
+
+	return bytes(packet)
+
+
+# Get captured byte stream from file, or synthesise byte stream of random packets.
+if len(sys.argv) > 1:
+	with open(sys.argv[1], "rb") as stream_file:
+		stream = stream_file.read()
+else:
+	random.seed(0)
+	stream = b"".join(encode_packet(bytes(random.randrange(256) for j in range(length - 3)))
+			for length in random.choices(sensor.PACKET_LENGTHS, k=PACKETS))
+
+# Decode byte stream byte by byte.
+ser = StreamPort(stream)
+bytewise_packets = []
+start_time = time.perf_counter()
+try:
+	while True:
+		bytewise_packets.append(read_packet_bytewise(ser))
+except IndexError:
+	pass
+bytewise_time = time.perf_counter() - start_time
+
+# Decode byte stream in chunks.
+reader = sensor.PacketReader(StreamPort(stream))
+chunked_packets = []
+start_time = time.perf_counter()
+while reader.ser.in_waiting:
+	chunked_packets.extend(reader.read_packets())
+chunked_time = time.perf_counter() - start_time
+
+print("Stream: " + str(len(stream)) + " bytes")
+print("Byte-by-byte reader: " + "{:12.0f}".format(len(bytewise_packets) / bytewise_time) + " packets/s")
+print("Chunked reader:      " + "{:12.0f}".format(len(chunked_packets) / chunked_time) + " packets/s")
+print("Packets match: " + str(bytewise_packets == chunked_packets))
@@ -6,6 +6,7 @@ import sensor
 import sensor_samples
 import utils
 
+import numpy
 import pickle
 
 # Starting orientation quaternion.
@@ -27,8 +28,8 @@ print("Samples collected.")
 # Close serial port.
 sensor.close_serial_port(ser)
 
-# Double integrate acceleration samples to get displacement samples.
-velocity_change, velocity, displacement_change, displacement = sensor_samples.get_displacement(acceleration)
+# Double integrate acceleration samples to get displacement samples, correcting drift while sensor stationary.
+velocity_change, velocity, displacement_change, displacement = sensor_samples.get_displacement(acceleration, True)
 
 # Create and open folder to save sensor data and graphs in.
 utils.create_folder()
@@ -41,25 +42,9 @@ with open("acceleration_data.pkl", "wb") as acceleration_fle:
 with open("sensor_data.txt", "a") as data_file:
 	data_file.write("Raw Acceleration (m/s^2) // Angular Velocity (rad/s) // Gravity (m/s^2) // Acceleration (m/s2) // "
 			"Velocity (m/s) // Displacement (m)\n\n")
-	for i in range(len(raw_acceleration[0])):
-		data_file.write("{:9.6f}".format(raw_acceleration[0][i]) + ", " +
-				"{:9.6f}".format(raw_acceleration[1][i]) + ", " +
-				"{:9.6f}".format(raw_acceleration[2][i]) + " // " +
-				"{:9.6f}".format(angular_velocity[0][i]) + ", " +
-				"{:9.6f}".format(angular_velocity[1][i]) + ", " +
-				"{:9.6f}".format(angular_velocity[2][i]) + " // " +
-				"{:9.6f}".format(gravity[0][i]) + ", " +
-				"{:9.6f}".format(gravity[1][i]) + ", " +
-				"{:9.6f}".format(gravity[2][i]) + " // " +
-				"{:9.6f}".format(acceleration[0][i]) + ", " +
-				"{:9.6f}".format(acceleration[1][i]) + ", " +
-				"{:9.6f}".format(acceleration[2][i]) + " // " +
-				"{:9.6f}".format(velocity[0][i]) + ", " +
-				"{:9.6f}".format(velocity[1][i]) + ", " +
-				"{:9.6f}".format(velocity[2][i]) + " // " +
-				"{:9.6f}".format(displacement[0][i]) + ", " +
-				"{:9.6f}".format(displacement[1][i]) + ", " +
-				"{:9.6f}".format(displacement[2][i]) + "\n\n")
+	# One row per sample, with each measurement as three comma separated values.
+	measurements = numpy.concatenate((raw_acceleration, angular_velocity, gravity, acceleration, velocity, displacement))
+	numpy.savetxt(data_file, measurements.T, fmt=" // ".join([", ".join(["%9.6f"] * 3)] * 6), newline="\n\n")
 
 # Plot displacement graph.
 print("Plotting graph...")
@@ -0,0 +1,67 @@
+# imuPIN - dtw_benchmark.py
+# Stuart McDaniel, 2016
+
+# Compares accuracy and query time of DTW transition classifier with Sakoe-Chiba bands of different widths against
+# Euclidean k-NN classifier, and reports share of training features pruned by lower bounds and early abandoning, by
+# cross-validation on training store.
+# Usage: python dtw_benchmark.py [k]
+
+import dtw_classifier
+import training_store
+import transition_classifier
+
+import numpy
+import sys
+import tempfile
+import time
+
+# CONSTANTS.
+# Sakoe-Chiba band half-widths compared.
+WINDOWS = [0, 1, 2, 3, 5, 8]
+# Number of cross-validation folds.
+FOLDS = 5
+
+if len(sys.argv) > 1:
+	k = int(sys.argv[1])
+else:
+	k = 5
+features, direction_classes = training_store.TrainingStore().get_training_features()
+features = numpy.array(features)
+random_state = numpy.random.RandomState(0)
+folds = numpy.array_split(random_state.permutation(len(features)), FOLDS)
+
+print(str(len(features)) + " training features, " + str(FOLDS) + "-fold cross-validation, k = " + str(k))
+print("Classifier  Accuracy   Query (ms)    LB_Kim  LB_Keogh Abandoned  Full DTW")
+for window in [None] + WINDOWS:
+	correct = 0
+	query_time = 0
+	counters = {"queries": 0, "candidates": 0, "kim_pruned": 0, "keogh_pruned": 0, "abandoned": 0, "computed": 0}
+	for fold in folds:
+		training = numpy.setdiff1d(numpy.arange(len(features)), fold)
+		with tempfile.TemporaryDirectory() as folder:
+			store = training_store.TrainingStore(folder)
+			store.append(features[training], direction_classes[training])
+
+			if window is None:
+				classifier = transition_classifier.TransitionClassifier(store)
+				start_time = time.perf_counter()
+				predictions = numpy.concatenate([classifier.predict([feature], k) for feature in features[fold]])
+				query_time += time.perf_counter() - start_time
+				classifier.close()
+			else:
+				classifier = dtw_classifier.DTWClassifier(store, window)
+				predictions = classifier.predict(features[fold], k)
+				stats = classifier.stats()
+				query_time += stats["mean_query_time"] * stats["queries"]
+				for counter in counters:
+					counters[counter] += stats[counter]
+
+			correct += numpy.count_nonzero(predictions == direction_classes[fold])
+
+	name = "Euclidean" if window is None else "DTW (" + str(window) + ")"
+	line = "{:10s}".format(name) + "{:10.1%}".format(correct / len(features)) + "{:13.3f}".format(
+			query_time / len(features) * 1000)
+	if window is not None:
+		for counter in ["kim_pruned", "keogh_pruned", "abandoned", "computed"]:
+			line += "{:10.1%}".format(counters[counter] / counters["candidates"])
+	print(line)
@@ -0,0 +1,185 @@
+# imuPIN - dtw_classifier.py
+# Stuart McDaniel, 2016
+
+# k-NN key transition classifier using dynamic time warping (DTW) distance, so features of transitions made at
+# different speeds match. Warping is limited to Sakoe-Chiba band. Training features are ordered by lower bound of DTW
+# distance (LB_Kim from first and last samples, and LB_Keogh from envelope of query within band), and those with lower
+# bound above k-th nearest distance so far are pruned without computing DTW. DTW is computed for batches of training
+# features at once, row by row, and abandoned for features whose every warping path already exceeds k-th nearest
+# distance.
+
+import training_store
+import transition_classifier
+import utils
+
+import numpy
+import time
+
+# CONSTANTS.
+# Sakoe-Chiba band half-width in samples (10% of FEATURE_SIZE).
+DTW_WINDOW = 3
+# Number of training features DTW computed for at once (after first k).
+DTW_BATCH = 32
+
+
+# k-NN classifier of training features in training store by DTW distance. Distances are sums of squared Euclidean
+# distances between 3-axis samples along warping path.
+class DTWClassifier:
+	def __init__(self, store=None, window=DTW_WINDOW):
+		self.window = window
+		self.store = store if store is not None else training_store.TrainingStore()
+		features, labels = self.store.load()
+		# Store files' signature when loaded.
+		self.signature = self.store.signature()
+		self.features = numpy.array(features, dtype=float).reshape(-1, 3, utils.FEATURE_SIZE)
+		self.labels = numpy.array(labels)
+
+		# Counters.
+		self.queries = 0
+		self.candidates = 0
+		self.kim_pruned = 0
+		self.keogh_pruned = 0
+		self.abandoned = 0
+		self.computed = 0
+		self.query_times = []
+
+	# Number of training features.
+	def __len__(self):
+		return len(self.labels)
+
+	# Classify features, each of shape (3, FEATURE_SIZE), by majority of k nearest training features.
+	# Returns array of names of classes.
+	def predict(self, features, k):
+		if len(self.labels) == 0:
+			raise ValueError("No training features.")
+		k = min(k, len(self.labels))
+		features = numpy.asarray(features, dtype=float).reshape(-1, 3, utils.FEATURE_SIZE)
+
+		neighbours = numpy.array([self.get_neighbours(feature, k) for feature in features]).reshape(-1, k)
+
+		return transition_classifier.vote(self.labels[neighbours])
+
+	# Get indexes of k nearest training features of feature of shape (3, FEATURE_SIZE), in no particular order.
+	def get_neighbours(self, feature, k):
+		start_time = time.perf_counter()
+
+		# Lower bounds of each training feature's distance.
+		kim = get_lb_kim(feature, self.features)
+		keogh = get_lb_keogh(feature, self.features, self.window)
+		bounds = numpy.maximum(kim, keogh)
+		order = numpy.argsort(bounds, kind="stable")
+
+		# Distances to and indexes of k nearest training features so far.
+		nearest_distances = numpy.zeros(0)
+		nearest = numpy.zeros(0, dtype=int)
+		threshold = numpy.inf
+		# First batch is k nearest by lower bound, so threshold is set as soon as possible.
+		start = 0
+		batch_size = k
+		while start < len(order):
+			batch = order[start:start + batch_size]
+
+			# Prune training features whose lower bound exceeds k-th nearest distance. Features are in order of lower
+			# bound, so all later features are pruned too.
+			pruned = bounds[batch] >= threshold
+			if numpy.any(pruned):
+				remaining = order[start + numpy.argmax(pruned):]
+				self.kim_pruned += int(numpy.count_nonzero(kim[remaining] >= threshold))
+				self.keogh_pruned += int(numpy.count_nonzero(kim[remaining] < threshold))
+				batch = batch[~pruned]
+
+			distances = get_dtw_distances(feature, self.features[batch], self.window, threshold)
+			self.abandoned += int(numpy.count_nonzero(numpy.isinf(distances)))
+			self.computed += int(numpy.count_nonzero(numpy.isfinite(distances)))
+
+			# Keep k nearest.
+			nearest_distances = numpy.concatenate((nearest_distances, distances))
+			nearest = numpy.concatenate((nearest, batch))
+			if len(nearest) > k:
+				keep = numpy.argpartition(nearest_distances, k - 1)[:k]
+				nearest_distances = nearest_distances[keep]
+				nearest = nearest[keep]
+			if len(nearest) == k:
+				threshold = numpy.max(nearest_distances)
+			if numpy.any(pruned):
+				break
+			start += batch_size
+			batch_size = DTW_BATCH
+
+		self.queries += 1
+		self.candidates += len(self.labels)
+		self.query_times.append(time.perf_counter() - start_time)
+
+		return nearest
+
+	# Get pruning counters and query times.
+	def stats(self):
+		pruned = self.kim_pruned + self.keogh_pruned + self.abandoned
+
+		return {
+			"queries": self.queries,
+			"candidates": self.candidates,
+			"kim_pruned": self.kim_pruned,
+			"keogh_pruned": self.keogh_pruned,
+			"abandoned": self.abandoned,
+			"computed": self.computed,
+			"pruning_rate": pruned / self.candidates if self.candidates else 0.0,
+			"mean_query_time": sum(self.query_times) / len(self.query_times) if self.query_times else 0.0,
+			"max_query_time": max(self.query_times, default=0.0)
+		}
+
+
+# Get LB_Kim lower bound of DTW distance from feature to each training feature, array of shape (N, 3, FEATURE_SIZE).
+# Every warping path matches first samples and last samples.
+def get_lb_kim(feature, features):
+	bounds = numpy.sum((features[:, :, 0] - feature[:, 0]) ** 2, axis=1)
+	if feature.shape[1] > 1:
+		bounds += numpy.sum((features[:, :, -1] - feature[:, -1]) ** 2, axis=1)
+
+	return bounds
+
+
+# Get LB_Keogh lower bound of DTW distance from feature to each training feature, array of shape (N, 3, FEATURE_SIZE),
+# with Sakoe-Chiba band half-width. Sum of squared distances of training features outside feature's envelope.
+def get_lb_keogh(feature, features, window):
+	# Highest and lowest sample of feature within band of each sample.
+	windows = numpy.lib.stride_tricks.sliding_window_view(
+			numpy.pad(feature, ((0, 0), (window, window)), mode="edge"), 2 * window + 1, axis=1)
+	upper = numpy.max(windows, axis=2)
+	lower = numpy.min(windows, axis=2)
+
+	return numpy.sum(numpy.maximum(features - upper, 0) ** 2 + numpy.maximum(lower - features, 0) ** 2, axis=(1, 2))
+
+
+# Get DTW distances from feature to training features, array of shape (N, 3, FEATURE_SIZE), with Sakoe-Chiba band
+# half-width. Features whose distance is not below threshold are abandoned, and their distance is infinity.
+def get_dtw_distances(feature, features, window, threshold=numpy.inf):
+	size = feature.shape[1]
+	distances = numpy.full(len(features), numpy.inf)
+
+	# Squared distance from each sample of feature (rows) to each sample of each training feature (columns).
+	costs = numpy.sum((feature[numpy.newaxis, :, :, numpy.newaxis] - features[:, :, numpy.newaxis, :]) ** 2, axis=1)
+	indexes = numpy.arange(len(features))
+
+	# Cumulative distances of previous row, with column before first sample.
+	previous = numpy.full((len(features), size + 1), numpy.inf)
+	previous[:, 0] = 0
+	for i in range(size):
+		current = numpy.full((len(indexes), size + 1), numpy.inf)
+		for j in range(max(0, i - window), min(size, i + window + 1)):
+			current[:, j + 1] = costs[:, i, j] + numpy.minimum(numpy.minimum(previous[:, j], previous[:, j + 1]),
+					current[:, j])
+
+		# Abandon training features whose every warping path through row is not below threshold.
+		keep = numpy.min(current, axis=1) < threshold
+		if not numpy.all(keep):
+			costs = costs[keep]
+			current = current[keep]
+			indexes = indexes[keep]
+		previous = current
+		if len(indexes) == 0:
+			break
+
+	distances[indexes] = previous[:, size]
+
+	return distances
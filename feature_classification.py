@@ -38,15 +38,17 @@ peaks = pattern_recognition.find_peaks(compressed, 2)
 # Segment PIN entry acceleration.
 segments = pattern_recognition.segment_pin_entry(compressed, peaks)
 
-# If found at least one segment.
-if len(segments) >= 1:
-	# Extract key transition features from PIN entry segment.
-	features = pattern_recognition.extract_features(segments[0])
-	# Classify key transition features using k-NN classification algorithm and training features.
-	transitions = pattern_recognition.classify_features(features, 1)
-	print("PIN transition directions: " + transitions[0] + ", " + transitions[1] + ", " + transitions[2])
-	# Get PINs that match key transition classes, in order of frequency.
-	matching_pins = pins.get_matching_pins("pin_files/pins.csv", transitions)
+# Extract and classify key transition features of all PIN entry segments together, using k-NN classification algorithm
+# and training features.
+segments_transitions = [transitions for transitions in pattern_recognition.classify_segments(segments, 1)
+		if transitions is not None]
+
+# If classified at least one segment.
+if len(segments_transitions) >= 1:
+	for transitions in segments_transitions:
+		print("PIN transition directions: " + transitions[0] + ", " + transitions[1] + ", " + transitions[2])
+	# Get PINs that match key transition classes of any segment, in order of likelihood.
+	matching_pins = pins.get_matching_pins_segments("pin_files/pins.csv", segments_transitions)
 	print("Matching PINs (in order of likelihood):")
 	for pin in matching_pins:
 		print(pin)
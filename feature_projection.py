@@ -0,0 +1,64 @@
+# imuPIN - feature_projection.py
+# Stuart McDaniel, 2016
+
+# Principal component projection of key transition features into fewer dimensions, so nearest neighbour search is
+# faster. Fitted on training store and saved beside it. Not refitted as training features are added, so refit with
+# fit_projection after training set changes greatly.
+
+import training_store
+import utils
+
+import numpy
+import os
+
+# CONSTANTS.
+# Projection file name, in training store folder.
+PROJECTION_FILE = "projection.npz"
+
+
+# Projection of features onto principal components.
+class FeatureProjection:
+	def __init__(self, mean, components):
+		self.mean = numpy.asarray(mean, dtype=training_store.FEATURE_DTYPE)
+		self.components = numpy.asarray(components, dtype=training_store.FEATURE_DTYPE)
+
+	# Number of dimensions features projected into.
+	def dimensions(self):
+		return len(self.components)
+
+	# Project features, each of shape (3, FEATURE_SIZE). Returns array of shape (N, dimensions).
+	def project(self, features):
+		features = numpy.asarray(features, dtype=training_store.FEATURE_DTYPE).reshape(-1, 3 * utils.FEATURE_SIZE)
+
+		return (features - self.mean) @ self.components.T
+
+
+# Fit projection into number of dimensions to features, array of shape (N, 3 * FEATURE_SIZE).
+def fit_features(features, dimensions):
+	features = numpy.asarray(features, dtype=float)
+	mean = numpy.mean(features, axis=0)
+
+	# Principal components are right singular vectors of centred features, in order of variance.
+	components = numpy.linalg.svd(features - mean, full_matrices=False)[2][:dimensions]
+
+	return FeatureProjection(mean, components)
+
+
+# Fit projection into number of dimensions to training store, and save it beside store.
+def fit_projection(store, dimensions):
+	projection = fit_features(store.load()[0], dimensions)
+	numpy.savez(os.path.join(store.folder, PROJECTION_FILE), mean=projection.mean, components=projection.components)
+
+	return projection
+
+
+# Get projection into number of dimensions saved beside training store, fitting it if not saved with that number.
+def get_projection(store, dimensions):
+	projection_file = os.path.join(store.folder, PROJECTION_FILE)
+	if os.path.isfile(projection_file):
+		with numpy.load(projection_file) as arrays:
+			projection = FeatureProjection(arrays["mean"], arrays["components"])
+		if projection.dimensions() == dimensions:
+			return projection
+
+	return fit_projection(store, dimensions)
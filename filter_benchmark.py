@@ -0,0 +1,87 @@
+# imuPIN - filter_benchmark.py
+# Stuart McDaniel, 2016
+
+# Compares samples per second of scalar, recording, and lockstep Madgwick orientation filters, then cost per sample
+# and gravity removal error of each orientation filter engine.
+# Usage: python filter_benchmark.py [number of samples] [number of recordings]
+
+import madgwick
+import orientation_filters
+import sensor_samples
+import utils
+
+import numpy
+import sys
+import time
+
+# Number of samples per recording and number of recordings.
+if len(sys.argv) > 1:
+	samples = int(sys.argv[1])
+else:
+	samples = 20000
+if len(sys.argv) > 2:
+	recordings = int(sys.argv[2])
+else:
+	recordings = 64
+
+# Random samples around 1 g on z-axis.
+random_state = numpy.random.RandomState(0)
+sensor_values = random_state.normal(0, 0.5, (recordings, samples, 6))
+sensor_values[:, :, 2] += 1
+
+# Scalar filter, one call per sample.
+start_time = time.perf_counter()
+q = (1, 0, 0, 0)
+scalar_quaternions = []
+for ax, ay, az, gx, gy, gz in sensor_values[0].tolist():
+	q = madgwick.orientation_filter(q, (gx, gy, gz), (ax, ay, az))
+	scalar_quaternions.append(q)
+scalar_time = time.perf_counter() - start_time
+
+# Recording filter.
+start_time = time.perf_counter()
+recording_quaternions = madgwick.orientation_filter_samples((1, 0, 0, 0), sensor_values[0])
+recording_time = time.perf_counter() - start_time
+
+# Lockstep filter across recordings.
+start_time = time.perf_counter()
+lockstep_quaternions = madgwick.orientation_filter_recordings(numpy.tile([1.0, 0.0, 0.0, 0.0], (recordings, 1)),
+		sensor_values)
+lockstep_time = time.perf_counter() - start_time
+
+print("Scalar filter:     " + "{:12.0f}".format(samples / scalar_time) + " samples/s")
+print("Recording filter:  " + "{:12.0f}".format(samples / recording_time) + " samples/s, max difference " +
+		"{:.2e}".format(numpy.abs(recording_quaternions - scalar_quaternions).max()))
+print("Lockstep filter:   " + "{:12.0f}".format(recordings * samples / lockstep_time) + " samples/s (" +
+		str(recordings) + " recordings), max difference " +
+		"{:.2e}".format(numpy.abs(lockstep_quaternions[0] - scalar_quaternions).max()))
+
+# Synthetic recording with known orientation: smooth random angular velocity integrated into true quaternions, and
+# acceleration of true gravity plus small linear acceleration.
+times = numpy.arange(samples) / utils.SAMPLE_FREQ
+angular_velocity = numpy.stack([0.8 * numpy.sin(times * (0.7 + 0.3 * i) + i) for i in range(3)], axis=1)
+true_quaternions = numpy.empty((samples, 4))
+q = numpy.array([1.0, 0.0, 0.0, 0.0])
+for i in range(samples):
+	gx, gy, gz = angular_velocity[i]
+	q0, q1, q2, q3 = q
+	q = q + 0.5 / utils.SAMPLE_FREQ * numpy.array([-q1 * gx - q2 * gy - q3 * gz, q0 * gx + q2 * gz - q3 * gy,
+			q0 * gy - q1 * gz + q3 * gx, q0 * gz + q1 * gy - q2 * gx])
+	q /= numpy.sqrt(numpy.sum(q * q))
+	true_quaternions[i] = q
+true_gravity = sensor_samples.get_gravity(true_quaternions, False)
+linear_acceleration = random_state.normal(0, 0.05, (samples, 3))
+recording = numpy.concatenate((true_gravity + linear_acceleration, angular_velocity +
+		random_state.normal(0, 0.01, (samples, 3))), axis=1)
+
+# Skip first two seconds while engines converge.
+settled = int(2 * utils.SAMPLE_FREQ)
+
+print()
+print("Engine     Cost (us/sample)   Gravity error (g RMS)")
+for name in orientation_filters.ENGINES:
+	engine = orientation_filters.get_engine(name)
+	quaternions = engine.filter_samples(true_quaternions[0], recording)
+	error = sensor_samples.get_gravity(quaternions, False)[settled:] - true_gravity[settled:]
+	print("{:10s}".format(name) + "{:17.2f}".format(engine.cost_per_sample() * 1e6) +
+			"{:24.4f}".format(numpy.sqrt(numpy.mean(numpy.sum(error * error, axis=1)))))
@@ -6,6 +6,10 @@ import matplotlib.pyplot
 import mpl_toolkits.mplot3d.axes3d
 import numpy
 
+# CONSTANTS.
+# Most frames in displacement animation. Longer recordings skip samples between frames.
+DISPLACEMENT_FRAMES = 600
+
 
 # Plot acceleration graph.
 def plot_acceleration_graph(acceleration, x_axis_length, y_axis_size, image_name):
@@ -74,8 +78,10 @@ def plot_displacement_graph(displacement, axes_size, video_name):
 	ax.set_ylim3d(-axes_size, axes_size)
 	ax.set_zlim3d(-axes_size, axes_size)
 
-	# Animate graph.
-	line_animation = matplotlib.animation.FuncAnimation(fig, update_displacement_graph, len(displacement_array[0]),
+	# Animate graph, with each frame drawing samples up to evenly spaced sample number.
+	samples = displacement_array.shape[1]
+	frames = numpy.linspace(0, samples, min(samples + 1, DISPLACEMENT_FRAMES)).round().astype(int)
+	line_animation = matplotlib.animation.FuncAnimation(fig, update_displacement_graph, frames,
 			fargs=(displacement_array, line), interval=100, blit=False)
 
 	# Save graph as mp4 video.
@@ -83,7 +89,7 @@ def plot_displacement_graph(displacement, axes_size, video_name):
 	line_animation.save(video_name, writer=mp4_writer(fps=15))
 
 
-# Update displacement graph for each data point.
+# Update displacement graph to show samples before sample number num.
 def update_displacement_graph(num, data, line):
 	line.set_data(data[0:2, :num])
 	line.set_3d_properties(data[2, :num])
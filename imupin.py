@@ -5,6 +5,7 @@ import pattern_recognition
 import pins
 import sensor
 import sensor_samples
+import streaming_pipeline
 import utils
 
 import tkinter
@@ -33,8 +34,9 @@ def training_open():
 		# Calibrate sensor and get acceleration samples.
 		log_textbox.insert(tkinter.INSERT, "Calibrating sensor...\n")
 		root.update_idletasks()
-		q = sensor_samples.calibrate_sensor_compare(ser, q, False, True)
-		log_textbox.insert(tkinter.INSERT, "Sensor calibrated.\n")
+		calibration_stats = {}
+		q = sensor_samples.calibrate_sensor_compare(ser, q, False, True, stats=calibration_stats)
+		log_textbox.insert(tkinter.INSERT, "Sensor calibrated (" + str(calibration_stats["samples"]) + " samples).\n")
 		root.update_idletasks()
 		log_textbox.insert(tkinter.INSERT, "Collecting sensor samples...\n")
 		root.update_idletasks()
@@ -169,37 +171,34 @@ def classification_open():
 		# Calibrate sensor and get acceleration samples.
 		log_textbox.insert(tkinter.INSERT, "Calibrating sensor...\n")
 		root.update_idletasks()
-		q = sensor_samples.calibrate_sensor_compare(ser, q, False, True)
-		log_textbox.insert(tkinter.INSERT, "Sensor calibrated.\n")
+		calibration_stats = {}
+		q = sensor_samples.calibrate_sensor_compare(ser, q, False, True, stats=calibration_stats)
+		log_textbox.insert(tkinter.INSERT, "Sensor calibrated (" + str(calibration_stats["samples"]) + " samples).\n")
 		log_textbox.insert(tkinter.INSERT, "Collecting sensor samples...\n")
 		root.update_idletasks()
-		q, raw_acceleration, angular_velocity, gravity, acceleration = sensor_samples.get_acceleration(ser, q, 1000,
-				False, True)
+
+		# Quantise, segment, and classify 1000 samples as they are read. All candidate segments are kept, as overlapping
+		# segments found later may be the PIN entry.
+		pipeline = streaming_pipeline.StreamingPipeline(q, False, True)
+		candidates = list(pipeline.run(ser, 1000))
 		log_textbox.insert(tkinter.INSERT, "Samples collected.\n\n")
 		root.update_idletasks()
 
 		# Close serial port.
 		sensor.close_serial_port(ser)
 
-		# Quantise acceleration samples.
-		compressed = sensor_samples.quantise_compress(acceleration)
-
-		# Get z-axis acceleration peaks.
-		peaks = pattern_recognition.find_peaks(compressed, 2)
-
-		# Segment PIN entry acceleration.
-		segments = pattern_recognition.segment_pin_entry(compressed, peaks)
-
-		# If found at least one segment.
-		if len(segments) >= 1:
-			# Extract key transition features from PIN entry segment.
-			features = pattern_recognition.extract_features(segments[0])
-			# Classify key transition features using k-NN classification algorithm and training features.
-			transitions = pattern_recognition.classify_features(features, 5)
-			log_textbox.insert(tkinter.INSERT, "PIN transition directions: " + transitions[0] + ", " + transitions[1] +
-					", " + transitions[2] + "\n")
-			# Get PINs that match key transition classes, in order of frequency.
-			matching_pins = pins.get_matching_pins("pin_files/pins.csv", transitions)
+		# If recognised PIN entry.
+		if len(candidates) >= 1:
+			for candidate in candidates:
+				transitions = candidate["transitions"]
+				log_textbox.insert(tkinter.INSERT, "PIN transition directions: " + transitions[0] + ", " +
+						transitions[1] + ", " + transitions[2] + "\n")
+			# First candidate recognised soonest.
+			log_textbox.insert(tkinter.INSERT, "First recognised " + "{:.0f}".format(candidates[0]["latency"] * 1000) +
+					" ms after its last keystroke.\n")
+			# PINs that match key transition classes of any candidate segment, in order of likelihood.
+			matching_pins = pins.get_matching_pins_segments("pin_files/pins.csv",
+					[candidate["transitions"] for candidate in candidates])
 			log_textbox.insert(tkinter.INSERT, "Matching PINs (in order of likelihood):\n")
 			for pin in matching_pins:
 				if pin == generated_pin:
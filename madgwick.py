@@ -8,9 +8,13 @@
 
 import utils
 
+import numpy
+
 # CONSTANTS.
 # Algorithm beta gain.
 BETA_GAIN = 0.1
+# Sample period in seconds.
+SAMPLE_PERIOD = 1.0 / utils.SAMPLE_FREQ
 
 
 # Calculate orientation quaternion of sensor sample using previous quaternion.
@@ -60,10 +64,10 @@ def orientation_filter(q, ang, acc):
 		q_dot_3 -= BETA_GAIN * s2
 		q_dot_4 -= BETA_GAIN * s3
 
-	q0 += q_dot_1 * (1.0 / utils.SAMPLE_FREQ)
-	q1 += q_dot_2 * (1.0 / utils.SAMPLE_FREQ)
-	q2 += q_dot_3 * (1.0 / utils.SAMPLE_FREQ)
-	q3 += q_dot_4 * (1.0 / utils.SAMPLE_FREQ)
+	q0 += q_dot_1 * SAMPLE_PERIOD
+	q1 += q_dot_2 * SAMPLE_PERIOD
+	q2 += q_dot_3 * SAMPLE_PERIOD
+	q3 += q_dot_4 * SAMPLE_PERIOD
 
 	recip_norm = (q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3) ** (-1/2)
 	q0 *= recip_norm
@@ -72,3 +76,130 @@ def orientation_filter(q, ang, acc):
 	q3 *= recip_norm
 
 	return q0, q1, q2, q3
+
+
+# Calculate orientation quaternions of samples from independent sensors using previous quaternions.
+# Same as orientation_filter applied to each row of q (M, 4), ang (M, 3), and acc (M, 3) arrays.
+def orientation_filter_array(q, ang, acc):
+	q0, q1, q2, q3 = q.T
+	gx, gy, gz = ang.T
+	ax, ay, az = acc.T
+
+	q_dot_1 = 0.5 * (-q1 * gx - q2 * gy - q3 * gz)
+	q_dot_2 = 0.5 * (q0 * gx + q2 * gz - q3 * gy)
+	q_dot_3 = 0.5 * (q0 * gy - q1 * gz + q3 * gx)
+	q_dot_4 = 0.5 * (q0 * gz + q1 * gy - q2 * gx)
+
+	# Only apply accelerometer feedback to samples with non-zero acceleration.
+	valid = ~((ax == 0.0) & (ay == 0.0) & (az == 0.0))
+	recip_norm = numpy.zeros_like(ax)
+	recip_norm[valid] = (ax[valid] * ax[valid] + ay[valid] * ay[valid] + az[valid] * az[valid]) ** (-0.5)
+	ax = ax * recip_norm
+	ay = ay * recip_norm
+	az = az * recip_norm
+
+	_2q0 = 2.0 * q0
+	_2q1 = 2.0 * q1
+	_2q2 = 2.0 * q2
+	_2q3 = 2.0 * q3
+	_4q0 = 4.0 * q0
+	_4q1 = 4.0 * q1
+	_4q2 = 4.0 * q2
+	_8q1 = 8.0 * q1
+	_8q2 = 8.0 * q2
+	q0q0 = q0 * q0
+	q1q1 = q1 * q1
+	q2q2 = q2 * q2
+	q3q3 = q3 * q3
+
+	s0 = _4q0 * q2q2 + _2q2 * ax + _4q0 * q1q1 - _2q1 * ay
+	s1 = _4q1 * q3q3 - _2q3 * ax + 4.0 * q0q0 * q1 - _2q0 * ay - _4q1 + _8q1 * q1q1 + _8q1 * q2q2 + _4q1 * az
+	s2 = 4.0 * q0q0 * q2 + _2q0 * ax + _4q2 * q3q3 - _2q3 * ay - _4q2 + _8q2 * q1q1 + _8q2 * q2q2 + _4q2 * az
+	s3 = 4.0 * q1q1 * q3 - _2q1 * ax + 4.0 * q2q2 * q3 - _2q2 * ay
+
+	recip_norm = numpy.zeros_like(s0)
+	recip_norm[valid] = (s0[valid] * s0[valid] + s1[valid] * s1[valid] + s2[valid] * s2[valid] +
+			s3[valid] * s3[valid]) ** (-0.5)
+
+	q_dot_1 = q_dot_1 - BETA_GAIN * (s0 * recip_norm)
+	q_dot_2 = q_dot_2 - BETA_GAIN * (s1 * recip_norm)
+	q_dot_3 = q_dot_3 - BETA_GAIN * (s2 * recip_norm)
+	q_dot_4 = q_dot_4 - BETA_GAIN * (s3 * recip_norm)
+
+	q0 = q0 + q_dot_1 * SAMPLE_PERIOD
+	q1 = q1 + q_dot_2 * SAMPLE_PERIOD
+	q2 = q2 + q_dot_3 * SAMPLE_PERIOD
+	q3 = q3 + q_dot_4 * SAMPLE_PERIOD
+
+	recip_norm = (q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3) ** (-1/2)
+
+	return numpy.stack((q0 * recip_norm, q1 * recip_norm, q2 * recip_norm, q3 * recip_norm), axis=1)
+
+
+# Calculate orientation quaternions of recording of samples, array of shape (N, 6) with acceleration then angular
+# velocity, starting from previous quaternion, with algorithm beta gain. Returns array of shape (N, 4).
+# Equivalent to orientation_filter applied to each sample, with loop variables kept local and the gradient computed as
+# J^T f from the objective function f, which takes about half the operations (results differ only by rounding).
+def orientation_filter_samples(q, sensor_values, beta=BETA_GAIN):
+	q0, q1, q2, q3 = q
+	half_period = 0.5 * SAMPLE_PERIOD
+
+	quaternions = []
+	append = quaternions.append
+	for ax, ay, az, gx, gy, gz in numpy.asarray(sensor_values).tolist():
+		q_dot_1 = -q1 * gx - q2 * gy - q3 * gz
+		q_dot_2 = q0 * gx + q2 * gz - q3 * gy
+		q_dot_3 = q0 * gy - q1 * gz + q3 * gx
+		q_dot_4 = q0 * gz + q1 * gy - q2 * gx
+
+		if ax != 0.0 or ay != 0.0 or az != 0.0:
+			recip_norm = (ax * ax + ay * ay + az * az) ** (-0.5)
+
+			# Objective function: estimated minus measured direction of gravity.
+			f1 = 2.0 * (q1 * q3 - q0 * q2) - ax * recip_norm
+			f2 = 2.0 * (q0 * q1 + q2 * q3) - ay * recip_norm
+			f3 = 1.0 - 2.0 * (q1 * q1 + q2 * q2) - az * recip_norm
+
+			# Gradient (halved, as q_dot terms are doubled until integration).
+			s0 = q1 * f2 - q2 * f1
+			s1 = q3 * f1 + q0 * f2 - 2.0 * q1 * f3
+			s2 = q3 * f2 - q0 * f1 - 2.0 * q2 * f3
+			s3 = q1 * f1 + q2 * f2
+
+			recip_norm = 2.0 * beta * (s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3) ** (-0.5)
+			q_dot_1 -= s0 * recip_norm
+			q_dot_2 -= s1 * recip_norm
+			q_dot_3 -= s2 * recip_norm
+			q_dot_4 -= s3 * recip_norm
+
+		q0 += q_dot_1 * half_period
+		q1 += q_dot_2 * half_period
+		q2 += q_dot_3 * half_period
+		q3 += q_dot_4 * half_period
+
+		recip_norm = (q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3) ** (-0.5)
+		q0 *= recip_norm
+		q1 *= recip_norm
+		q2 *= recip_norm
+		q3 *= recip_norm
+
+		append((q0, q1, q2, q3))
+
+	return numpy.array(quaternions).reshape(-1, 4)
+
+
+# Calculate orientation quaternions of M independent recordings in lockstep, from previous quaternions array of shape
+# (M, 4) and samples array of shape (M, N, 6). Recordings shorter than N are given by lengths, and their quaternions
+# beyond their length repeat their last quaternion. Returns array of shape (M, N, 4).
+def orientation_filter_recordings(q, sensor_values, lengths=None):
+	q = numpy.array(q, dtype=float)
+	quaternions = numpy.empty(sensor_values.shape[:2] + (4,))
+	for j in range(sensor_values.shape[1]):
+		if lengths is None or (lengths > j).all():
+			q = orientation_filter_array(q, sensor_values[:, j, 3:], sensor_values[:, j, :3])
+		else:
+			active = lengths > j
+			q[active] = orientation_filter_array(q[active], sensor_values[active, j, 3:], sensor_values[active, j, :3])
+		quaternions[:, j] = q
+
+	return quaternions
@@ -0,0 +1,20 @@
+# imuPIN - migrate_training.py
+# Stuart McDaniel, 2016
+
+# Creates training store from per-direction training pickles, once, as first use of store does. Fails if store already
+# exists.
+# Usage: python migrate_training.py [training folder]
+
+import training_store
+
+import sys
+
+# Training folder.
+if len(sys.argv) > 1:
+	folder = sys.argv[1]
+else:
+	folder = training_store.TRAINING_FOLDER
+
+store = training_store.TrainingStore(folder)
+training_store.migrate_training_pickles(store)
+print(str(len(store)) + " training features migrated to " + folder + ".")
@@ -0,0 +1,169 @@
+# imuPIN - multi_sensor.py
+# Stuart McDaniel, 2016
+
+# Concurrent ingestion from several sensors. Each sensor has its own capture thread, ring buffer, orientation
+# quaternion, and sample buffers, while fusion and gravity removal run as array operations across all sensors.
+# Calibration runs in lockstep, taking waiting samples of every sensor in one loop, but each sensor has its own
+# calibration, which filters its samples and checks its gravity separately, as sensors calibrate after different numbers
+# of samples.
+
+import capture
+import madgwick
+import sensor
+import sensor_samples
+
+import numpy
+import time
+
+# CONSTANTS.
+# Seconds to wait when no sensor has samples waiting.
+IDLE_WAIT = 0.002
+
+
+# Ingestion of acceleration samples from several sensors.
+class MultiSensorIngest:
+	def __init__(self, sers, metres, radians, capacity=capture.RING_CAPACITY):
+		self.captures = [capture.SerialCapture(ser, capacity) for ser in sers]
+		self.metres = metres
+		self.radians = radians
+		# Orientation quaternion of each sensor.
+		self.q = numpy.tile([1.0, 0.0, 0.0, 0.0], (len(sers), 1))
+		# Sample buffers of each sensor: lists of raw acceleration, angular velocity, gravity, and acceleration chunks.
+		self.chunks = [([], [], [], []) for ser in sers]
+		self.counts = numpy.zeros(len(sers), dtype=numpy.int64)
+		# Latency from sample read to sample fused (seconds) of each sensor.
+		self.latency_total = numpy.zeros(len(sers))
+		self.latency_max = numpy.zeros(len(sers))
+		self.steps = 0
+		self.start_time = None
+
+	# Start capture threads.
+	def start(self):
+		for sensor_capture in self.captures:
+			sensor_capture.start()
+		self.start_time = time.perf_counter()
+
+		return self
+
+	# Stop capture threads.
+	def stop(self):
+		for sensor_capture in self.captures:
+			sensor_capture.stop()
+
+	# Calibrate all sensors in lockstep by reading samples until each sensor's gravity relatively constant.
+	# Samples after each sensor's calibration are kept for step.
+	def calibrate(self):
+		calibrations = [sensor_samples.CompareCalibration(tuple(q), self.metres) for q in self.q]
+		while not all(calibration.calibrated for calibration in calibrations):
+			samples = 0
+			for i, calibration in enumerate(calibrations):
+				if calibration.calibrated:
+					continue
+				values, times = self.take_samples(i)
+				samples += len(values)
+				if calibration.update(values):
+					self.q[i] = calibration.q
+					sensor_samples.return_samples(self.captures[i], calibration.remaining)
+			if samples == 0:
+				self.check_errors()
+				time.sleep(IDLE_WAIT)
+
+	# Take samples waiting from sensor, with samples returned after calibration first, timed when taken.
+	# Returns sensor values, array of shape (N, 6), and their read times.
+	def take_samples(self, i):
+		counts, times = self.captures[i].buffer.pop()
+		values = sensor.scale_counts(counts, self.metres, self.radians)
+
+		returned = sensor_samples.take_returned_samples(self.captures[i])
+		if returned is not None:
+			values = numpy.concatenate((returned, values))
+			times = numpy.concatenate((numpy.full(len(returned), time.perf_counter()), times))
+
+		return values, times
+
+	# Raise error of any sensor whose capture stopped with error and has no samples waiting.
+	def check_errors(self):
+		for sensor_capture in self.captures:
+			if sensor_capture.error is not None and len(sensor_capture.buffer) == 0:
+				raise sensor_capture.error
+
+	# Fuse samples waiting from every sensor. Returns number of samples fused.
+	def step(self):
+		# Take waiting samples of each sensor.
+		batches = [self.take_samples(i) for i in range(len(self.captures))]
+		lengths = numpy.array([len(values) for values, times in batches])
+		length = lengths.max(initial=0)
+		if length == 0:
+			time.sleep(IDLE_WAIT)
+			return 0
+
+		# Arrange samples of all sensors as array of shape (sensors, length, 6).
+		sensor_values = numpy.zeros((len(batches), length, 6))
+		for i, (values, times) in enumerate(batches):
+			sensor_values[i, :len(values)] = values
+
+		# Calculate orientation quaternions of all sensors in lockstep.
+		q = madgwick.orientation_filter_recordings(self.q, sensor_values, lengths)
+		self.q = q[:, -1]
+
+		# Calculate gravity and remove from raw acceleration for all sensors.
+		gravity = sensor_samples.get_gravity(q, self.metres)
+		acceleration = sensor_values[:, :, :3] - gravity
+
+		# Append to sample buffers of each sensor.
+		fused_time = time.perf_counter()
+		for i, (values, times) in enumerate(batches):
+			if len(values) == 0:
+				continue
+			self.chunks[i][0].append(sensor_values[i, :len(values), :3])
+			self.chunks[i][1].append(sensor_values[i, :len(values), 3:])
+			self.chunks[i][2].append(gravity[i, :len(values)])
+			self.chunks[i][3].append(acceleration[i, :len(values)])
+			self.latency_total[i] += numpy.sum(fused_time - times)
+			self.latency_max[i] = max(self.latency_max[i], fused_time - times.min())
+		self.counts += lengths
+		self.steps += 1
+
+		return int(lengths.sum())
+
+	# Fuse samples until every sensor has at least number of samples.
+	def collect(self, samples):
+		while self.counts.min(initial=samples) < samples:
+			self.step()
+			self.check_errors()
+
+	# Get acceleration samples of each sensor, as list of (q, raw acceleration, angular velocity, gravity,
+	# acceleration) with arrays of shape (3, N), then clear sample buffers.
+	def get_acceleration(self):
+		results = []
+		for i, chunks in enumerate(self.chunks):
+			arrays = []
+			for axis_chunks in chunks:
+				if axis_chunks:
+					arrays.append(numpy.concatenate(axis_chunks).T)
+				else:
+					arrays.append(numpy.zeros((3, 0)))
+				axis_chunks.clear()
+			results.append((tuple(self.q[i]),) + tuple(arrays))
+
+		return results
+
+	# Get per-sensor and total throughput and latency.
+	def stats(self):
+		elapsed = time.perf_counter() - self.start_time
+		devices = []
+		for i, sensor_capture in enumerate(self.captures):
+			device = sensor_capture.stats()
+			device["fused"] = int(self.counts[i])
+			device["samples_per_second"] = float(self.counts[i] / elapsed)
+			device["mean_latency"] = float(self.latency_total[i] / self.counts[i]) if self.counts[i] else 0.0
+			device["max_latency"] = float(self.latency_max[i])
+			devices.append(device)
+
+		return {
+			"devices": devices,
+			"fused": int(self.counts.sum()),
+			"samples_per_second": float(self.counts.sum() / elapsed),
+			"steps": self.steps,
+			"elapsed": elapsed
+		}
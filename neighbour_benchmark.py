@@ -0,0 +1,88 @@
+# imuPIN - neighbour_benchmark.py
+# Stuart McDaniel, 2016
+
+# Compares build and classification time of transition classifier neighbour backends as training set grows, and
+# reports training set sizes at which fastest backend changes.
+# Usage: python neighbour_benchmark.py [largest number of training features] [leaf size]
+
+import training_store
+import transition_classifier
+import utils
+
+import numpy
+import sys
+import tempfile
+import time
+
+# CONSTANTS.
+# Training set sizes compared.
+SIZES = [100, 300, 1000, 3000, 10000, 30000, 100000, 300000]
+# Number of features classified together in batch.
+BATCH_FEATURES = 300
+# Number of timed classifications of each size.
+REPEATS = 20
+
+# Largest training set and leaf size.
+if len(sys.argv) > 1:
+	largest = int(sys.argv[1])
+else:
+	largest = SIZES[-1]
+if len(sys.argv) > 2:
+	leaf_size = int(sys.argv[2])
+else:
+	leaf_size = transition_classifier.TREE_LEAF_SIZE
+backends = ["brute"] + list(transition_classifier.TREES)
+
+# Random features clustered around centre of each key transition class.
+random_state = numpy.random.RandomState(0)
+centres = random_state.normal(0, 1, (len(utils.DIRECTIONS), 3 * utils.FEATURE_SIZE))
+
+
+# Random features and names of their classes.
+def get_features(size):
+	labels = random_state.randint(len(utils.DIRECTIONS), size=size)
+	features = centres[labels] + random_state.normal(0, 1.5, (size, 3 * utils.FEATURE_SIZE))
+
+	return features.astype(numpy.float32), [utils.DIRECTIONS[label] for label in labels]
+
+
+pin_features = get_features(3)[0]
+batch_features = get_features(BATCH_FEATURES)[0]
+
+print("Features  Backend      Build (ms)   PIN (ms)   Batch of " + str(BATCH_FEATURES) + " (ms)")
+fastest = []
+for size in [size for size in SIZES if size <= largest]:
+	with tempfile.TemporaryDirectory() as folder:
+		store = training_store.TrainingStore(folder)
+		store.append(*get_features(size))
+
+		pin_times = {}
+		for backend in backends:
+			classifier = transition_classifier.TransitionClassifier(store, backend, leaf_size)
+
+			# First classification builds search tree.
+			start_time = time.perf_counter()
+			classifier.predict(pin_features, 5)
+			build_time = time.perf_counter() - start_time
+
+			start_time = time.perf_counter()
+			for i in range(REPEATS):
+				classifier.predict(pin_features, 5)
+			pin_times[backend] = (time.perf_counter() - start_time) / REPEATS
+
+			start_time = time.perf_counter()
+			classifier.predict(batch_features, 5)
+			batch_time = time.perf_counter() - start_time
+			classifier.close()
+
+			print("{:8d}".format(size) + "  " + "{:10s}".format(backend) + "{:13.2f}".format(build_time * 1000) +
+					"{:11.3f}".format(pin_times[backend] * 1000) + "{:22.2f}".format(batch_time * 1000))
+
+	fastest.append((size, min(pin_times, key=pin_times.get)))
+
+# Sizes at which fastest backend for classifying one PIN changes.
+print()
+print("Fastest backend for one PIN: " + fastest[0][1] + " from " + str(fastest[0][0]) + " features")
+for (previous_size, previous_backend), (size, backend) in zip(fastest, fastest[1:]):
+	if backend != previous_backend:
+		print("Crossover to " + backend + " between " + str(previous_size) + " and " + str(size) + " features")
@@ -0,0 +1,197 @@
+# imuPIN - orientation_filters.py
+# Stuart McDaniel, 2016
+
+# Orientation filter engines used by sensor_samples for calibration and gravity removal.
+# Each engine calculates orientation quaternions of a batch of samples, array of shape (N, 6) with acceleration then
+# angular velocity, starting from the previous quaternion, and records its cost per sample.
+# Mahony algorithm based on Sebastian Madgwick's implementation.
+# http://www.x-io.co.uk/res/sw/madgwick_algorithm_c.zip
+
+import madgwick
+import utils
+
+import numpy
+import scipy.signal
+import time
+
+# CONSTANTS.
+# Mahony algorithm proportional gain (twoKp in reference implementation).
+MAHONY_PROPORTIONAL_GAIN = 1.0
+# Mahony algorithm integral gain (twoKi in reference implementation).
+MAHONY_INTEGRAL_GAIN = 0.0
+# Tilt filter accelerometer smoothing factor per sample (1 for no smoothing).
+TILT_SMOOTHING = 0.05
+
+
+# Orientation filter engine base, recording time spent and samples filtered.
+class OrientationFilter:
+	name = ""
+
+	def __init__(self):
+		self.samples = 0
+		self.time = 0.0
+
+	# Calculate orientation quaternions of samples using previous quaternion, with feedback gain multiplied by gain_scale.
+	# Returns array of shape (N, 4).
+	def filter_samples(self, q, sensor_values, gain_scale=1.0):
+		start_time = time.perf_counter()
+		q = tuple(numpy.asarray(q, dtype=float).tolist())
+		quaternions = self.calculate(q, numpy.asarray(sensor_values, dtype=float).reshape(-1, 6), gain_scale)
+		self.time += time.perf_counter() - start_time
+		self.samples += len(quaternions)
+
+		return quaternions
+
+	# Calculate orientation quaternions of samples (implemented by each engine).
+	def calculate(self, q, sensor_values, gain_scale):
+		raise NotImplementedError
+
+	# Average seconds per sample filtered.
+	def cost_per_sample(self):
+		return self.time / self.samples if self.samples else 0.0
+
+	# Reset cost counters.
+	def reset_cost(self):
+		self.samples = 0
+		self.time = 0.0
+
+
+# Madgwick IMU algorithm.
+class MadgwickFilter(OrientationFilter):
+	name = "madgwick"
+
+	def __init__(self, beta=madgwick.BETA_GAIN):
+		super().__init__()
+		self.beta = beta
+
+	def calculate(self, q, sensor_values, gain_scale):
+		return madgwick.orientation_filter_samples(q, sensor_values, self.beta * gain_scale)
+
+
+# Mahony complementary filter IMU algorithm.
+# Integral feedback is kept by engine, so use separate engine for each sensor if integral gain is non-zero.
+class MahonyFilter(OrientationFilter):
+	name = "mahony"
+
+	def __init__(self, proportional_gain=MAHONY_PROPORTIONAL_GAIN, integral_gain=MAHONY_INTEGRAL_GAIN):
+		super().__init__()
+		self.proportional_gain = proportional_gain
+		self.integral_gain = integral_gain
+		self.integral = [0.0, 0.0, 0.0]
+
+	def calculate(self, q, sensor_values, gain_scale):
+		q0, q1, q2, q3 = q
+		two_kp = self.proportional_gain * gain_scale
+		two_ki = self.integral_gain
+		period = 1.0 / utils.SAMPLE_FREQ
+		integral_x, integral_y, integral_z = self.integral
+
+		quaternions = []
+		append = quaternions.append
+		for ax, ay, az, gx, gy, gz in sensor_values.tolist():
+			if ax != 0.0 or ay != 0.0 or az != 0.0:
+				recip_norm = (ax * ax + ay * ay + az * az) ** (-0.5)
+				ax *= recip_norm
+				ay *= recip_norm
+				az *= recip_norm
+
+				# Estimated direction of gravity (halved).
+				half_vx = q1 * q3 - q0 * q2
+				half_vy = q0 * q1 + q2 * q3
+				half_vz = q0 * q0 - 0.5 + q3 * q3
+
+				# Error is cross product between estimated and measured direction of gravity (halved).
+				half_ex = ay * half_vz - az * half_vy
+				half_ey = az * half_vx - ax * half_vz
+				half_ez = ax * half_vy - ay * half_vx
+
+				# Integral feedback.
+				if two_ki > 0.0:
+					integral_x += two_ki * half_ex * period
+					integral_y += two_ki * half_ey * period
+					integral_z += two_ki * half_ez * period
+					gx += integral_x
+					gy += integral_y
+					gz += integral_z
+
+				# Proportional feedback.
+				gx += two_kp * half_ex
+				gy += two_kp * half_ey
+				gz += two_kp * half_ez
+
+			# Integrate rate of change of quaternion.
+			gx *= 0.5 * period
+			gy *= 0.5 * period
+			gz *= 0.5 * period
+			qa = q0
+			qb = q1
+			qc = q2
+			q0 += -qb * gx - qc * gy - q3 * gz
+			q1 += qa * gx + qc * gz - q3 * gy
+			q2 += qa * gy - qb * gz + q3 * gx
+			q3 += qa * gz + qb * gy - qc * gx
+
+			recip_norm = (q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3) ** (-0.5)
+			q0 *= recip_norm
+			q1 *= recip_norm
+			q2 *= recip_norm
+			q3 *= recip_norm
+
+			append((q0, q1, q2, q3))
+
+		self.integral = [integral_x, integral_y, integral_z]
+
+		return numpy.array(quaternions).reshape(-1, 4)
+
+
+# Accelerometer tilt only. Orientation (without yaw) is calculated from smoothed direction of acceleration, ignoring
+# angular velocity. Cheapest engine, as all samples are calculated as array operations.
+class TiltFilter(OrientationFilter):
+	name = "tilt"
+
+	def __init__(self, smoothing=TILT_SMOOTHING):
+		super().__init__()
+		self.smoothing = smoothing
+
+	def calculate(self, q, sensor_values, gain_scale):
+		smoothing = min(self.smoothing * gain_scale, 1.0)
+
+		# Normalise acceleration, ignoring zero samples.
+		acceleration = sensor_values[:, :3]
+		norm = numpy.sqrt(numpy.sum(acceleration * acceleration, axis=1, keepdims=True))
+		direction = numpy.divide(acceleration, norm, out=numpy.zeros_like(acceleration), where=norm > 0)
+
+		# Smooth direction with first-order low-pass filter, starting from direction of gravity of previous quaternion.
+		q0, q1, q2, q3 = q
+		previous = numpy.array([2 * (q1 * q3 - q0 * q2), 2 * (q0 * q1 + q2 * q3), q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3])
+		direction, final = scipy.signal.lfilter([smoothing], [1.0, smoothing - 1.0], direction, axis=0,
+				zi=(1.0 - smoothing) * previous[numpy.newaxis, :])
+
+		return get_tilt_quaternions(direction)
+
+
+# Calculate orientation quaternions (without yaw) from directions of gravity, array of shape (N, 3).
+# Returns array of shape (N, 4).
+def get_tilt_quaternions(direction):
+	gx, gy, gz = (direction / numpy.sqrt(numpy.sum(direction * direction, axis=1, keepdims=True))).T
+
+	# Shortest rotation quaternion with gravity direction (gx, gy, gz).
+	q0 = numpy.sqrt(numpy.maximum((1.0 + gz) / 2, 1e-12))
+
+	return numpy.stack((q0, gy / (2 * q0), -gx / (2 * q0), numpy.zeros_like(q0)), axis=1)
+
+
+# Engine classes by name.
+ENGINES = {engine.name: engine for engine in (MadgwickFilter, MahonyFilter, TiltFilter)}
+
+
+# Get new orientation filter engine by name (utils.ORIENTATION_FILTER if not given), or return engine given.
+# Engines keep state between batches (such as Mahony integral feedback and cost counters), so each stream of samples
+# should get its own engine and pass it to every batch.
+def get_engine(engine=None):
+	if engine is None:
+		engine = utils.ORIENTATION_FILTER
+	if isinstance(engine, OrientationFilter):
+		return engine
+
+	return ENGINES[engine]()
@@ -1,138 +1,354 @@
 # imuPIN - pattern_recognition.py
 # Stuart McDaniel, 2016
 
+import dtw_classifier
+import feature_projection
+import training_store
+import transition_classifier
 import utils
 
+import atexit
 import numpy
-import os
 import peakutils
-import pickle
-import scipy.interpolate
-import sklearn.neighbors
+import time
+
+# CONSTANTS.
+# Peak threshold, relative to range of acceleration.
+PEAK_THRESHOLD = 0.25
+# Minimum number of samples between peaks.
+PEAK_MIN_DIST = 10
+# Number of samples range of acceleration is taken over by online peak detector.
+PEAK_WINDOW = 400
+# Smallest range of acceleration (g) in which online peak detector finds peaks, so noise alone has no peaks.
+PEAK_MIN_RANGE = 0.1
+# Smallest range of acceleration in which online peak detector finds peaks, relative to noise (median absolute
+# difference between consecutive samples), so quiet or noisy stretches without keystrokes have no peaks.
+PEAK_NOISE_RANGE = 12
 
 
 # Get ?-axis acceleration peaks.
 def find_peaks(acceleration, peaks_axis):
-	return peakutils.peak.indexes(numpy.array(acceleration[peaks_axis]), thres=0.25, min_dist=10)
+	return peakutils.peak.indexes(numpy.array(acceleration[peaks_axis]), thres=PEAK_THRESHOLD, min_dist=PEAK_MIN_DIST)
+
+
+# Incremental peak detector for acceleration given in chunks, with find_peaks' threshold and minimum distance.
+# Threshold is relative to range of last window samples, up to min_dist + 1 samples after peak. Peaks are rejected
+# unless range of those samples up to peak is keystroke-scale (at least min_range, and noise_range times noise), as
+# find_peaks' range over whole recording is, so quiet or noisy stretches before first keystroke have no peaks. As in
+# find_peaks, highest peaks are kept first, and peaks within min_dist samples of kept peak are removed, so peak is
+# confirmed min_dist + 1 samples after it unless a higher peak near it is still unconfirmed. Flat-topped peaks are not
+# found.
+# Keeps last window samples and unconfirmed peaks only, so memory does not grow with length of recording.
+class OnlinePeakDetector:
+	def __init__(self, thres=PEAK_THRESHOLD, min_dist=PEAK_MIN_DIST, window=PEAK_WINDOW, min_range=PEAK_MIN_RANGE,
+			noise_range=PEAK_NOISE_RANGE):
+		self.thres = thres
+		self.min_dist = min_dist
+		self.window = max(window, min_dist + 2)
+		self.min_range = min_range
+		self.noise_range = noise_range
+		# Last samples, and number of samples given.
+		self.samples = numpy.zeros(0)
+		self.count = 0
+		# Unconfirmed peaks as [sample number, value, above threshold (None until known)].
+		self.candidates = []
+		# Confirmed peaks that may be within min_dist of unconfirmed peaks, as (sample number, value).
+		self.kept = []
+
+	# Add chunk of samples, 1-D array. Returns array of sample numbers of peaks confirmed, in order.
+	def update(self, values):
+		values = numpy.asarray(values, dtype=float).reshape(-1)
+		start = self.count - len(self.samples)
+		samples = numpy.concatenate((self.samples, values))
+		first = max(self.count - 1, 1)
+		self.count += len(values)
+
+		# Local maxima with both neighbouring samples given.
+		difference = numpy.diff(samples)
+		rising = difference[first - start - 1:-1] > 0
+		falling = difference[first - start:] < 0
+		for index in numpy.flatnonzero(rising & falling) + first:
+			self.candidates.append([int(index), float(samples[index - start]), None])
+
+		# Threshold peaks once all peaks within min_dist after them are found.
+		for candidate in self.candidates:
+			if candidate[2] is None and candidate[0] + self.min_dist + 1 < self.count:
+				end = candidate[0] + self.min_dist + 2 - start
+				self.set_threshold(candidate, samples[max(end - self.window, 0):end], start + max(end - self.window, 0))
+
+		self.samples = samples[-self.window:]
+
+		return self.confirm()
+
+	# Confirm remaining peaks at end of samples. Returns array of sample numbers of peaks confirmed, in order.
+	def flush(self):
+		for candidate in self.candidates:
+			if candidate[2] is None:
+				self.set_threshold(candidate, self.samples, self.count - len(self.samples))
+
+		return self.confirm()
+
+	# Set whether peak above threshold of samples starting at sample number start. Range of samples up to peak must be
+	# keystroke-scale, so noise just before first keystroke is not compared with keystroke after it.
+	def set_threshold(self, candidate, samples, start):
+		low = numpy.min(samples)
+		high = numpy.max(samples)
+		candidate[2] = bool(self.keystroke_range(samples[:candidate[0] - start + 1]) and
+				candidate[1] > self.thres * (high - low) + low)
+
+	# Whether range of samples is keystroke-scale: at least min_range, and noise_range times noise (median absolute
+	# difference between consecutive samples).
+	def keystroke_range(self, samples):
+		sample_range = numpy.max(samples) - numpy.min(samples)
+		noise = numpy.median(numpy.abs(numpy.diff(samples))) if len(samples) > 1 else 0
+
+		return sample_range >= self.min_range and sample_range >= self.noise_range * noise
+
+	# Confirm peaks, highest first, with no higher unconfirmed peaks within min_dist.
+	def confirm(self):
+		self.candidates = [candidate for candidate in self.candidates if candidate[2] is not False]
+
+		confirmed = []
+		changed = True
+		while changed:
+			changed = False
+			for candidate in sorted(self.candidates, key=lambda candidate: (candidate[1], candidate[0]), reverse=True):
+				index, value, above = candidate
+				if any(abs(index - peak) <= self.min_dist for peak, peak_value in self.kept):
+					# Removed by higher peak.
+					self.candidates.remove(candidate)
+					changed = True
+				elif above and not any(abs(index - other[0]) <= self.min_dist and (other[1], other[0]) > (value, index)
+						for other in self.candidates):
+					self.candidates.remove(candidate)
+					self.kept.append((index, value))
+					confirmed.append(index)
+					changed = True
+
+		# Forget confirmed peaks too far before unconfirmed peaks and next samples.
+		oldest = min([candidate[0] for candidate in self.candidates] + [self.count - 1])
+		self.kept = [(peak, value) for peak, value in self.kept if peak >= oldest - self.min_dist]
+
+		return numpy.array(sorted(confirmed), dtype=int)
+
+
+# Find PIN entry segments from sequences of four z-axis acceleration peaks.
+# Returns arrays of first and last (exclusive) sample numbers of segments.
+def find_segments(peaks):
+	peaks = numpy.asarray(peaks, dtype=int)
+
+	# If not enough z-axis acceleration peaks for PIN entry.
+	if len(peaks) < 4:
+		return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+
+	# Each sequence of four peaks, normalised.
+	# [2, 4, 6, 8] becomes [0, 2, 4, 6].
+	sequences = numpy.lib.stride_tricks.sliding_window_view(peaks, 4)
+	normalised = sequences - sequences[:, :1]
+
+	# Segments where peaks relatively equidistant.
+	segment_length = normalised[:, 3]
+	second = normalised[:, 1] / segment_length
+	third = normalised[:, 2] / segment_length
+	equidistant = (0.21 <= second) & (second <= 0.45) & (0.54 <= third) & (third <= 0.78)
+
+	return numpy.maximum(sequences[equidistant, 0] - 2, 0), sequences[equidistant, 3] + 3
 
 
 # Segment PIN entry acceleration.
+# Returns list of segments, each view of acceleration array of shape (3, N).
 def segment_pin_entry(acceleration, peaks):
-	segments = []
+	acceleration = numpy.asarray(acceleration)
+	starts, ends = find_segments(peaks)
 
-	# If enough z-axis acceleration peaks for PIN entry.
-	if len(peaks) >= 4:
-		# For each sequence of four peaks.
-		for i in range(len(peaks) - 3):
-			# Create and normalise possible PIN entry segment.
-			# [2, 4, 6, 8] becomes [0, 2, 4, 6].
-			possible_segment = list(peaks[i:i + 4])
-			for j in range(3, -1, -1):
-				possible_segment[j] -= possible_segment[0]
-
-			# Add segment if peaks relatively equidistant.
-			segment_length = possible_segment[3] - possible_segment[0]
-			if 0.21 <= (possible_segment[1] / segment_length) <= 0.45:
-				if 0.54 <= (possible_segment[2] / segment_length) <= 0.78:
-					segments.append((list(acceleration[0][peaks[i] - 2:peaks[i + 3] + 3]),
-							list(acceleration[1][peaks[i] - 2:peaks[i + 3] + 3]),
-							list(acceleration[2][peaks[i] - 2:peaks[i + 3] + 3])))
-
-	return segments
+	return [acceleration[:, start:end] for start, end in zip(starts, ends)]
 
 
 # Extract key transition features from acceleration.
+# Returns array of shape (number of features, 3, FEATURE_SIZE).
 def extract_features(acceleration):
+	acceleration = numpy.asarray(acceleration)
+
 	# Get z-axis acceleration peaks.
 	peaks = find_peaks(acceleration, 2)
 
 	# Extract acceleration between peaks.
-	features = []
-	for i in range(len(peaks) - 1):
-		feature = (list(acceleration[0][peaks[i] + 1:peaks[i + 1]]),
-				list(acceleration[1][peaks[i] + 1:peaks[i + 1]]),
-				list(acceleration[2][peaks[i] + 1:peaks[i + 1]]))
-		# Change number of samples in feature using linear interpolation.
-		features.append(resample_feature(feature, utils.FEATURE_SIZE))
+	features = [acceleration[:, peaks[i] + 1:peaks[i + 1]] for i in range(len(peaks) - 1)]
 
-	return features
+	# Change number of samples in features using linear interpolation.
+	return resample_features(features, utils.FEATURE_SIZE)
 
 
 # Change number of samples in feature using linear interpolation.
 def resample_feature(feature, new_size):
-	# Number of samples in feature.
-	sample_numbers = range(len(feature[0]))
+	return resample_features([feature], new_size)[0]
 
-	# Resample each axis of feature using linear interpolation.
-	resampled_feature = [], [], []
-	for i in range(3):
-		# Calculate function of axis.
-		function = scipy.interpolate.interp1d(sample_numbers, feature[i])
-		# Calculate new samples using axis function.
-		for j in range(new_size):
-			resampled_feature[i].append(float(function(j / (new_size - 1) * (len(feature[i]) - 1))))
 
-	return resampled_feature
+# Change number of samples in features, each of shape (3, N) with any N, using linear interpolation.
+# All features are interpolated together. Returns array of shape (number of features, 3, new_size).
+def resample_features(features, new_size):
+	features = [numpy.asarray(feature, dtype=float).reshape(3, -1) for feature in features]
+	if not features:
+		return numpy.zeros((0, 3, new_size))
+	lengths = numpy.array([feature.shape[1] for feature in features])
 
+	# Position of each new sample in its feature, and of first sample of each feature in all features.
+	positions = numpy.arange(new_size) / (new_size - 1) * (lengths[:, numpy.newaxis] - 1)
+	offsets = numpy.cumsum(lengths) - lengths
 
-# Add training feature to training file.
-def add_training_feature(feature, direction_class):
-	# Get training features from training file.
-	training_features = []
-	if os.path.isfile("training_files/" + direction_class + ".pkl"):
-		with open("training_files/" + direction_class + ".pkl", "rb") as features_file:
-			training_features = pickle.load(features_file)
+	# Samples either side of each new sample.
+	low = numpy.floor(positions).astype(int)
+	high = numpy.minimum(low + 1, lengths[:, numpy.newaxis] - 1)
+	fraction = positions - low
 
-	# Add new feature to training features.
-	training_features.append(numpy.reshape(feature, -1))
+	# Interpolate all axes of all features.
+	samples = numpy.concatenate(features, axis=1)
+	low_values = samples[:, low + offsets[:, numpy.newaxis]]
+	high_values = samples[:, high + offsets[:, numpy.newaxis]]
 
-	# Write training features to training file.
-	with open("training_files/" + direction_class + ".pkl", "wb") as features_file:
-		pickle.dump(training_features, features_file)
+	# New samples exactly at samples are copied, as interp1d does.
+	resampled = numpy.where(fraction == 0, low_values, (high_values - low_values) * fraction + low_values)
 
+	return numpy.moveaxis(resampled, 0, 1)
 
-# Delete last training feature from training file.
-def delete_last_training_feature(direction_class):
-	# Get training features from training file.
-	training_features = []
-	if os.path.isfile("training_files/" + direction_class + ".pkl"):
-		with open("training_files/" + direction_class + ".pkl", "rb") as features_file:
-			training_features = pickle.load(features_file)
 
-	# Remove last training feature.
-	training_features.pop()
+# Add training feature to training store.
+def add_training_feature(feature, direction_class):
+	classifier_cache.get()[0].add(feature, direction_class)
+
 
-	# Write training features to training file.
-	with open("training_files/" + direction_class + ".pkl", "wb") as features_file:
-		pickle.dump(training_features, features_file)
+# Delete last training feature of class from training store.
+def delete_last_training_feature(direction_class):
+	classifier_cache.get()[0].remove_last(direction_class)
 
 
-# Get training features from training files.
+# Get training features, array of shape (N, 3 * FEATURE_SIZE), and names of classes from training store.
 def get_training_features():
-	# For each key transition class, open file and get each training feature and name of class.
-	training_features = []
-	direction_classes = []
-	for direction in utils.DIRECTIONS:
-		with open("training_files/" + direction + ".pkl", "rb") as features_file:
-			class_features = pickle.load(features_file)
-			for class_feature in class_features:
-				training_features.append(class_feature)
-				direction_classes.append(direction)
+	return training_store.TrainingStore().get_training_features()
+
+
+# Get modification time and size of training store files.
+def get_training_signature():
+	return training_store.TrainingStore().signature()
+
+
+# Process-wide k-NN classifier of training features, loaded once. Training features are added and deleted through
+# classifier, which writes them to training store. Reloaded when training store changed other than by classifier.
+class ClassifierCache:
+	def __init__(self):
+		self.classifier = None
+		# Classifications with loading (cold) and without (warm), and total seconds taken.
+		self.cold = 0
+		self.warm = 0
+		self.cold_time = 0.0
+		self.warm_time = 0.0
+
+	# Get classifier, and whether it was already loaded.
+	def get(self):
+		classifier = self.classifier
+		cached = classifier is not None and (not classifier.persisted() or
+				classifier.signature == get_training_signature())
+		if not cached:
+			self.close()
+			store = training_store.TrainingStore()
+			projection = None
+			if utils.PROJECTION_DIMENSIONS:
+				projection = feature_projection.get_projection(store, utils.PROJECTION_DIMENSIONS)
+			self.classifier = transition_classifier.TransitionClassifier(store, projection=projection)
+
+		return self.classifier, cached
+
+	# Write classifier's changes to training store, and forget classifier. Raises error of failed change.
+	def close(self):
+		classifier = self.classifier
+		self.classifier = None
+		if classifier is not None:
+			classifier.close()
+
+	# Record seconds taken by classification.
+	def record(self, cached, duration):
+		if cached:
+			self.warm += 1
+			self.warm_time += duration
+		else:
+			self.cold += 1
+			self.cold_time += duration
+
+	# Get cache counters.
+	def stats(self):
+		return {
+			"cold": self.cold,
+			"warm": self.warm,
+			"mean_cold_time": self.cold_time / self.cold if self.cold else 0.0,
+			"mean_warm_time": self.warm_time / self.warm if self.warm else 0.0,
+			"training_features": len(self.classifier) if self.classifier is not None else 0
+		}
+
+
+classifier_cache = ClassifierCache()
+# Write changes waiting for training store before exit.
+atexit.register(classifier_cache.close)
+
+
+# DTW classifier of training features, reloaded when training store changed.
+dtw_cache = None
+
+
+# Get DTW classifier of training features, and whether it was already loaded.
+def get_dtw_classifier():
+	global dtw_cache
+
+	# Training features added through k-NN classifier are written to training store first.
+	classifier = classifier_cache.classifier
+	if classifier is not None and not classifier.persisted():
+		classifier.flush()
+	cached = dtw_cache is not None and dtw_cache.signature == get_training_signature()
+	if not cached:
+		dtw_cache = dtw_classifier.DTWClassifier()
+
+	return dtw_cache, cached
+
+
+# Classify key transition features, array of shape (N, 3, FEATURE_SIZE), using k-NN classification algorithm and
+# training features. Returns array of N names of classes.
+def classify_features(features, k):
+	if utils.TRANSITION_DISTANCE == "dtw":
+		return classify_features_dtw(features, k)
 
-	return training_features, direction_classes
+	start_time = time.perf_counter()
 
+	# Get k-NN classifier of training features.
+	classifier, cached = classifier_cache.get()
 
-# Classify key transition features using k-NN classification algorithm and training features.
-def classify_features(features, k):
-	# Create k-NN classification algorithm.
-	knn = sklearn.neighbors.KNeighborsClassifier(n_neighbors=k)
+	# Classify features using k-NN classification algorithm.
+	transitions = classifier.predict(features, k)
+	classifier_cache.record(cached, time.perf_counter() - start_time)
 
-	# Get training features and names of classes from training files.
-	training_features, direction_classes = get_training_features()
+	return transitions
 
-	# Add training data to k-NN classification algorithm.
-	knn.fit(numpy.asarray(training_features), numpy.asarray(direction_classes))
 
-	# Classify features using k-NN classification algorithm.
-	return knn.predict([numpy.reshape(features[0], -1), numpy.reshape(features[1], -1),
-			numpy.reshape(features[2], -1)])
+# Classify key transition features using k-NN classification algorithm with DTW distance and training features.
+def classify_features_dtw(features, k):
+	start_time = time.perf_counter()
+
+	# Get DTW classifier of training features.
+	classifier, cached = get_dtw_classifier()
+
+	transitions = classifier.predict(features, k)
+	classifier_cache.record(cached, time.perf_counter() - start_time)
+
+	return transitions
+
+
+# Classify first three key transition features of each PIN entry segment together, in one classification.
+# Returns list of key transition classes of each segment, or None for segments with fewer than three features.
+def classify_segments(segments, k):
+	segments_features = [extract_features(segment) for segment in segments]
+	complete = [features[:3] for features in segments_features if len(features) >= 3]
+	if len(complete) == 0:
+		return [None] * len(segments)
+
+	# Classify features of all segments together, then split them by segment.
+	transitions = iter(numpy.reshape(classify_features(numpy.concatenate(complete), k), (-1, 3)).tolist())
+
+	return [next(transitions) if len(features) >= 3 else None for features in segments_features]
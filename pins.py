@@ -115,19 +115,32 @@ def generate_frequency_pin(pins_filename):
 
 # Get PINs that match key transition classes, in order of frequency.
 def get_matching_pins(pins_filename, directions):
+	return get_matching_pins_segments(pins_filename, [directions])
+
+
+# Get PINs that match key transition classes of any of several segments, without duplicates.
+# PINs matching more segments come first, then in order of frequency.
+def get_matching_pins_segments(pins_filename, segments_directions):
 	# Get PINs from file.
 	with open(pins_filename, "r") as pins_file:
 		reader = csv.reader(pins_file)
 		pins = list(reader)
 		pins.pop()
 
-	# Add PIN if key transition classes match.
+	# Count segments each PIN's key transition classes match.
+	segments_directions = [tuple(directions) for directions in segments_directions]
 	matching_pins = []
+	matches = []
 	for row in pins:
-		if directions[0] == row[2] and directions[1] == row[3] and directions[2] == row[4]:
+		count = segments_directions.count(tuple(row[2:5]))
+		if count:
 			matching_pins.append(row[0])
+			matches.append(count)
 
-	return matching_pins
+	# Sort is stable, so PINs matching same number of segments stay in order of frequency.
+	order = sorted(range(len(matching_pins)), key=lambda i: -matches[i])
+
+	return [matching_pins[i] for i in order]
 
 
 # Get PINs that match specific key transition classes, in order of frequency.
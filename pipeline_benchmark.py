@@ -0,0 +1,80 @@
+# imuPIN - pipeline_benchmark.py
+# Stuart McDaniel, 2016
+
+# Times each stage of classification pipeline on replayed capture file.
+# Usage: python pipeline_benchmark.py <capture file> [replay speed (0 for as fast as possible)]
+
+import pattern_recognition
+import replay
+import sensor
+import sensor_samples
+import streaming_pipeline
+import utils
+
+import sys
+import time
+
+# Replay speed.
+if len(sys.argv) > 2:
+	speed = float(sys.argv[2])
+else:
+	speed = 0
+
+timings = []
+
+# Open replayed serial port.
+ser = replay.ReplaySerial(sys.argv[1], speed)
+q = (1, 0, 0, 0)
+
+# Calibrate sensor and get acceleration samples.
+start_time = time.perf_counter()
+q = sensor_samples.calibrate_sensor_compare(ser, q, False, True)
+timings.append(("Calibration", time.perf_counter() - start_time))
+
+start_time = time.perf_counter()
+q, raw_acceleration, angular_velocity, gravity, acceleration = sensor_samples.get_acceleration(ser, q, 1000, False,
+		True)
+timings.append(("Acquisition (" + str(len(acceleration[0])) + " samples)", time.perf_counter() - start_time))
+
+# Close serial port.
+sensor.close_serial_port(ser)
+
+# Quantise acceleration samples.
+start_time = time.perf_counter()
+compressed = sensor_samples.quantise_compress(acceleration)
+timings.append(("Compression", time.perf_counter() - start_time))
+
+# Get z-axis acceleration peaks and segment PIN entry acceleration.
+start_time = time.perf_counter()
+peaks = pattern_recognition.find_peaks(compressed, 2)
+segments = pattern_recognition.segment_pin_entry(compressed, peaks)
+timings.append(("Segmentation (" + str(len(segments)) + " segments)", time.perf_counter() - start_time))
+
+# Extract and classify key transition features of all segments together.
+if len(segments) >= 1:
+	start_time = time.perf_counter()
+	segments_transitions = [transitions for transitions in pattern_recognition.classify_segments(segments, 5)
+			if transitions is not None]
+	timings.append(("Classification (" + str(len(segments_transitions)) + " segments)",
+			time.perf_counter() - start_time))
+
+for stage, duration in timings:
+	print("{:45s}".format(stage) + "{:10.2f}".format(duration * 1000) + " ms")
+print("{:45s}".format("Total") + "{:10.2f}".format(sum(duration for stage, duration in timings) * 1000) + " ms")
+
+# Stream same capture through streaming pipeline, reporting latency from last keystroke to each candidate PIN list.
+ser = replay.ReplaySerial(sys.argv[1], speed)
+q = sensor_samples.calibrate_sensor_compare(ser, (1, 0, 0, 0), False, True)
+pipeline = streaming_pipeline.StreamingPipeline(q, False, True)
+print("\nStreaming pipeline:")
+for candidate in pipeline.run(ser, 1000):
+	print("Samples " + str(candidate["start"] * utils.WINDOW_SLIDE) + "-" + str(candidate["end"] * utils.WINDOW_SLIDE) +
+			" (" + ", ".join(candidate["transitions"]) + "): " + "{:.2f}".format(candidate["latency"] * 1000) + " ms")
+sensor.close_serial_port(ser)
+print("Mean latency: " + "{:.2f}".format(pipeline.stats()["mean_latency"] * 1000) + " ms")
+
+# Classifier cache, fitted on first classification only.
+cache_stats = pattern_recognition.classifier_cache.stats()
+print("Classifier cache: " + str(cache_stats["cold"]) + " cold (" +
+		"{:.2f}".format(cache_stats["mean_cold_time"] * 1000) + " ms), " + str(cache_stats["warm"]) + " warm (" +
+		"{:.2f}".format(cache_stats["mean_warm_time"] * 1000) + " ms)")
@@ -0,0 +1,79 @@
+# imuPIN - projection_benchmark.py
+# Stuart McDaniel, 2016
+
+# Compares accuracy and classification time of transition classifier with features projected into fewer dimensions,
+# by cross-validation on training store, or on random clustered features if number of features is given.
+# Usage: python projection_benchmark.py [number of random features] [k]
+
+import feature_projection
+import training_store
+import transition_classifier
+import utils
+
+import numpy
+import sys
+import tempfile
+import time
+
+# CONSTANTS.
+# Numbers of dimensions compared (None for no projection).
+DIMENSIONS = [None, 4, 8, 12, 16, 24, 32]
+# Number of cross-validation folds.
+FOLDS = 5
+# Number of timed classifications of one PIN in each fold.
+REPEATS = 20
+
+# Training features, array of shape (N, 3 * FEATURE_SIZE), and names of their classes.
+random_state = numpy.random.RandomState(0)
+if len(sys.argv) > 1:
+	# Random features clustered around centre of each key transition class.
+	size = int(sys.argv[1])
+	centres = random_state.normal(0, 1, (len(utils.DIRECTIONS), 3 * utils.FEATURE_SIZE))
+	labels = random_state.randint(len(utils.DIRECTIONS), size=size)
+	features = (centres[labels] + random_state.normal(0, 1.5, (size, 3 * utils.FEATURE_SIZE))).astype(numpy.float32)
+	direction_classes = numpy.asarray(utils.DIRECTIONS)[labels]
+else:
+	features, direction_classes = training_store.TrainingStore().get_training_features()
+	features = numpy.array(features)
+if len(sys.argv) > 2:
+	k = int(sys.argv[2])
+else:
+	k = 5
+folds = numpy.array_split(random_state.permutation(len(features)), FOLDS)
+
+print(str(len(features)) + " training features, " + str(FOLDS) + "-fold cross-validation, k = " + str(k))
+print("Dimensions  Accuracy   Retained   PIN (ms)   Speed-up")
+full_accuracy = None
+full_time = None
+for dimensions in DIMENSIONS:
+	correct = 0
+	pin_time = 0
+	for fold in folds:
+		training = numpy.setdiff1d(numpy.arange(len(features)), fold)
+		with tempfile.TemporaryDirectory() as folder:
+			store = training_store.TrainingStore(folder)
+			store.append(features[training], direction_classes[training])
+
+			# Projection fitted on training folds only.
+			projection = None
+			if dimensions is not None:
+				projection = feature_projection.fit_features(features[training], dimensions)
+			classifier = transition_classifier.TransitionClassifier(store, projection=projection)
+
+			correct += numpy.count_nonzero(classifier.predict(features[fold], k) == direction_classes[fold])
+
+			start_time = time.perf_counter()
+			for i in range(REPEATS):
+				classifier.predict(features[fold[:3]], k)
+			pin_time += (time.perf_counter() - start_time) / REPEATS
+			classifier.close()
+
+	accuracy = correct / len(features)
+	pin_time /= FOLDS
+	if dimensions is None:
+		full_accuracy = accuracy
+		full_time = pin_time
+
+	print("{:10s}".format(str(dimensions if dimensions is not None else 3 * utils.FEATURE_SIZE)) +
+			"{:10.1%}".format(accuracy) + "{:11.1%}".format(accuracy / full_accuracy if full_accuracy else 0) +
+			"{:11.3f}".format(pin_time * 1000) + "{:10.2f}x".format(full_time / pin_time))
@@ -0,0 +1,140 @@
+# imuPIN - replay.py
+# Stuart McDaniel, 2016
+
+# Capture files of timestamped sensor packets, and replay of capture files in place of serial port.
+# Capture file format: 16-byte header, then fixed-size little-endian records of CAPTURE_DTYPE, appended as packets are
+# read. Packets are stored unescaped, including SLIP_END and SECOND bytes.
+
+import sensor
+
+import numpy
+import os
+import time
+
+# CONSTANTS.
+# Capture file header.
+CAPTURE_HEADER = b"imuPIN capture1\n"
+# Largest packet size stored in capture file.
+CAPTURE_PACKET_SIZE = 38
+# Capture file record: time packet read (seconds since epoch), packet length, and packet bytes.
+CAPTURE_DTYPE = numpy.dtype([("time", "<f8"), ("length", "<u2"), ("packet", "u1", CAPTURE_PACKET_SIZE)])
+# Bytes held by replayed serial port buffer.
+REPLAY_BUFFER_SIZE = 4096
+
+
+# Append-only capture file writer.
+class CaptureWriter:
+	def __init__(self, file_name):
+		new_file = not os.path.isfile(file_name) or os.path.getsize(file_name) == 0
+		self.file = open(file_name, "ab")
+		if new_file:
+			self.file.write(CAPTURE_HEADER)
+
+	# Append packets read at time.
+	def write_packets(self, packets, read_time):
+		records = numpy.zeros(len(packets), dtype=CAPTURE_DTYPE)
+		records["time"] = read_time
+		for i, packet in enumerate(packets):
+			packet = packet[:CAPTURE_PACKET_SIZE]
+			records["length"][i] = len(packet)
+			records["packet"][i, :len(packet)] = numpy.frombuffer(packet, dtype=numpy.uint8)
+		self.file.write(records.tobytes())
+
+	# Flush and close capture file.
+	def close(self):
+		self.file.close()
+
+
+# Record number of packets from serial port to capture file.
+def record_capture(ser, file_name, packets):
+	writer = CaptureWriter(file_name)
+	reader = sensor.get_packet_reader(ser)
+
+	count = 0
+	while count < packets:
+		read_packets = reader.read_packets()
+		writer.write_packets(read_packets, time.time())
+		count += len(read_packets)
+
+	writer.close()
+
+
+# Memory-map records of capture file.
+def load_capture(file_name):
+	with open(file_name, "rb") as capture_file:
+		if capture_file.read(len(CAPTURE_HEADER)) != CAPTURE_HEADER:
+			raise ValueError(file_name + " is not a capture file.")
+
+	# Ignore partly written last record.
+	records = (os.path.getsize(file_name) - len(CAPTURE_HEADER)) // CAPTURE_DTYPE.itemsize
+	if records == 0:
+		return numpy.zeros(0, dtype=CAPTURE_DTYPE)
+
+	return numpy.memmap(file_name, dtype=CAPTURE_DTYPE, mode="r", offset=len(CAPTURE_HEADER), shape=(records,))
+
+
+# Escape and frame packet as sent by sensor.
+def encode_packet(packet):
+	body = bytes(packet[2:-1])
+	body = body.replace(bytes([sensor.SLIP_ESC]), bytes([sensor.SLIP_ESC, sensor.SLIP_ESC_ESC]))
+	body = body.replace(bytes([sensor.SLIP_END]), bytes([sensor.SLIP_ESC, sensor.SLIP_ESC_END]))
+
+	return bytes(packet[:2]) + body + bytes(packet[-1:])
+
+
+# Serial port that replays capture file, with read/write/close of serial.Serial.
+# Replays at real time with speed 1, N times real time with speed N, or as fast as possible with speed 0.
+class ReplaySerial:
+	def __init__(self, file_name, speed=1.0, timeout=5):
+		records = load_capture(file_name)
+		self.timeout = timeout
+		self.speed = speed
+		self.is_open = True
+
+		# Byte stream as sent by sensor, and time each packet's bytes arrive relative to first packet.
+		packets = [encode_packet(record["packet"][:record["length"]].tobytes()) for record in records]
+		self.stream = b"".join(packets)
+		self.ends = numpy.cumsum([len(packet) for packet in packets], dtype=numpy.int64)
+		self.times = numpy.asarray(records["time"]) - (records["time"][0] if len(records) else 0.0)
+		self.position = 0
+		self.start_time = time.perf_counter()
+
+	# Number of bytes arrived by now.
+	def arrived(self):
+		if not self.speed:
+			return len(self.stream)
+
+		elapsed = (time.perf_counter() - self.start_time) * self.speed
+		packets = numpy.searchsorted(self.times, elapsed, side="right")
+
+		return int(self.ends[packets - 1]) if packets else 0
+
+	# Number of bytes waiting to be read.
+	@property
+	def in_waiting(self):
+		return min(self.arrived() - self.position, REPLAY_BUFFER_SIZE)
+
+	# Read size bytes, waiting for them to arrive until timeout or end of capture.
+	def read(self, size=1):
+		deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+		while self.arrived() - self.position < size and self.arrived() < len(self.stream):
+			# Sleep until next packet arrives or timeout.
+			next_packet = numpy.searchsorted(self.ends, self.arrived(), side="right")
+			delay = self.times[next_packet] / self.speed - (time.perf_counter() - self.start_time)
+			if deadline is not None:
+				if time.perf_counter() >= deadline:
+					break
+				delay = min(delay, deadline - time.perf_counter())
+			time.sleep(max(delay, 0))
+
+		data = self.stream[self.position:min(self.position + size, self.arrived())]
+		self.position += len(data)
+
+		return data
+
+	# Accept commands written to sensor.
+	def write(self, data):
+		return len(data)
+
+	def close(self):
+		self.is_open = False
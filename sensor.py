@@ -1,12 +1,17 @@
 # imuPIN - sensor.py
 # Stuart McDaniel, 2016
 
+import replay
 import utils
 
-import ctypes
+import collections
 import math
+import numpy
+import re
 import scipy.constants
 import serial
+import struct
+import weakref
 
 # CONSTANTS.
 # Start/end of packet indicator byte.
@@ -21,19 +26,48 @@ SLIP_ESC_END = 220
 SLIP_ESC_ESC = 221
 # Valid packet lengths.
 PACKET_LENGTHS = [28, 36]
-
-
-# Open named serial port for reading.
-def open_serial_port():
+# Accelerometer normalisation value for g.
+ACC_NORM_G = 4096.0
+# Accelerometer normalisation value for m/s^2.
+ACC_NORM_METRES = 4096.0 / scipy.constants.g
+# Gyrometer normalisation value for deg/s.
+GYRO_NORM_DEGREES = 0.07
+# Gyrometer normalisation value for rad/s.
+GYRO_NORM_RADIANS = math.radians(0.07)
+# Offset of accelerometer and gyrometer bytes in packet.
+PACKET_VALUES_OFFSET = 9
+# Accelerometer and gyrometer bytes format (little-endian 16-bit signed integers).
+PACKET_VALUES_FORMAT = "<6h"
+# Packet structure up to end of accelerometer and gyrometer bytes.
+PACKET_DTYPE = numpy.dtype([("header", "u1", PACKET_VALUES_OFFSET), ("values", "<i2", 6)])
+# Start of packet bytes.
+PACKET_START = bytes([SLIP_END, SECOND])
+# Escaped byte pairs within packet.
+ESCAPE_PATTERN = re.compile(bytes([SLIP_ESC]) + b"(.)", re.DOTALL)
+# Unescaped substitutions for escaped bytes.
+ESCAPE_SUBSTITUTIONS = {bytes([SLIP_ESC_END]): bytes([SLIP_END]), bytes([SLIP_ESC_ESC]): bytes([SLIP_ESC])}
+
+# Packet readers of open serial ports.
+packet_readers = weakref.WeakKeyDictionary()
+# Sensor values read but not used by calibration, by serial port or capture, given to next read.
+returned_samples = weakref.WeakKeyDictionary()
+
+
+# Open named serial port for reading (utils.SERIAL_PORT if not given).
+def open_serial_port(port_name=None):
+	# Replay capture file instead of sensor.
+	if utils.REPLAY_FILE is not None:
+		ser = replay.ReplaySerial(utils.REPLAY_FILE, utils.get_replay_speed())
 	# Open serial port.
-	ser = serial.Serial(
-		port=utils.SERIAL_PORT,
-		baudrate=115200,
-		bytesize=serial.EIGHTBITS,
-		parity=serial.PARITY_NONE,
-		stopbits=serial.STOPBITS_ONE,
-		timeout=5
-	)
+	else:
+		ser = serial.Serial(
+			port=port_name or utils.SERIAL_PORT,
+			baudrate=115200,
+			bytesize=serial.EIGHTBITS,
+			parity=serial.PARITY_NONE,
+			stopbits=serial.STOPBITS_ONE,
+			timeout=5
+		)
 
 	# Write start stream command.
 	ser.write("stream=1\r\n".encode("utf-8"))
@@ -41,96 +75,158 @@ def open_serial_port():
 	return ser
 
 
-# Get acceleration and angular velocity values from packet.
+# Packet reader that decodes serial bytes in chunks, keeping leftover bytes between reads.
+class PacketReader:
+	def __init__(self, ser):
+		self.ser = ser
+		self.buffer = bytearray()
+		self.packets = collections.deque()
+
+	# Read all bytes waiting in serial port buffer and return every complete packet.
+	def read_packets(self):
+		# Block for at least one byte, then take whatever else has arrived.
+		chunk = self.ser.read(size=max(self.ser.in_waiting, 1))
+		if not chunk:
+			raise serial.SerialException("Timed out reading from sensor.")
+		self.buffer += chunk
+
+		packets = []
+		position = 0
+		while True:
+			# Find SLIP_END and SECOND bytes to indicate start of packet.
+			start = self.buffer.find(PACKET_START, position)
+			if start == -1:
+				# Keep last byte in case it is SLIP_END of next packet start.
+				position = max(position, len(self.buffer) - 1)
+				break
+
+			# Find SLIP_END byte to indicate end of packet.
+			end = self.buffer.find(SLIP_END, start + 2)
+			if end == -1:
+				position = start
+				break
+
+			packets.append(unescape_packet(self.buffer[start:end + 1]))
+			position = end + 1
+
+		# Keep leftover bytes for next read.
+		del self.buffer[:position]
+
+		return packets
+
+	# Get next packet, reading from serial port if no packets waiting.
+	def read_packet(self):
+		while not self.packets:
+			self.packets.extend(self.read_packets())
+
+		return self.packets.popleft()
+
+
+# Replace SLIP_ESC SLIP_ESC_END and SLIP_ESC SLIP_ESC_ESC in whole packet.
+def unescape_packet(packet):
+	if SLIP_ESC not in packet:
+		return bytes(packet)
+
+	return ESCAPE_PATTERN.sub(lambda match: ESCAPE_SUBSTITUTIONS.get(match.group(1), match.group(1)), packet)
+
+
+# Get packet reader for serial port.
+def get_packet_reader(ser):
+	reader = packet_readers.get(ser)
+	if reader is None:
+		reader = PacketReader(ser)
+		packet_readers[ser] = reader
+
+	return reader
+
+
+# Get acceleration and angular velocity values from next packet.
 def get_sensor_values(ser, metres, radians):
-	# Accelerometer normalisation value for m/s^2.
+	return get_packet_values(get_packet_reader(ser).read_packet(), metres, radians)
+
+
+# Get acceleration and gyrometer normalisation values.
+def get_norms(metres, radians):
 	if metres:
-		acc_norm = 4096.0 / scipy.constants.g
-	# Accelerometer normalisation value for g.
+		acc_norm = ACC_NORM_METRES
 	else:
-		acc_norm = 4096.0
+		acc_norm = ACC_NORM_G
 
-	# Gyrometer normalisation value for rad/s.
 	if radians:
-		gyro_norm = math.radians(0.07)
-	# Gyrometer normalisation value for deg/s.
+		gyro_norm = GYRO_NORM_RADIANS
 	else:
-		gyro_norm = 0.07
-
-	packet = []
-
-	# Read first two bytes until found SLIP_END and SECOND bytes to indicate start of packet.
-	chars = [ser.read(size=1)[0]]
-	while True:
-		chars.append(ser.read(size=1)[0])
-		if chars[0] == SLIP_END and chars[1] == SECOND:
-			packet.append(chars[0])
-			packet.append(chars[1])
-			break
-		else:
-			chars = [chars[1]]
-
-	# Read and append bytes until found SLIP_END byte to indicate end of packet.
-	escaped = False
-	while True:
-		char = ser.read(size=1)[0]
-		# End of packet.
-		if char == SLIP_END:
-			packet.append(char)
-			break
-		# SLIP_ESC_END or SLIP_ESC_ESC will follow.
-		elif char == SLIP_ESC:
-			escaped = True
-		# SLIP_ESC SLIP_ESC_END represents SLIP_END in data.
-		elif char == SLIP_ESC_END:
-			if escaped:
-				packet.append(SLIP_END)
-				escaped = False
-			else:
-				packet.append(char)
-		# SLIP_ESC SLIP_ESC_ESC represents SLIP_ESC in data.
-		elif char == SLIP_ESC_ESC:
-			if escaped:
-				packet.append(SLIP_ESC)
-				escaped = False
-			else:
-				packet.append(char)
-		# Any other byte.
-		else:
-			packet.append(char)
+		gyro_norm = GYRO_NORM_DEGREES
 
+	return acc_norm, gyro_norm
+
+
+# Get acceleration and angular velocity values from packets waiting at serial port as array of shape (N, 6).
+# Packets beyond max_packets are kept for next read.
+def get_sensor_values_batch(ser, metres, radians, max_packets=None):
+	return scale_counts(get_sensor_counts_batch(ser, max_packets), metres, radians)
+
+
+# Get accelerometer and gyrometer counts from packets waiting at serial port as array of shape (N, 6).
+# Packets beyond max_packets are kept for next read.
+def get_sensor_counts_batch(ser, max_packets=None):
+	reader = get_packet_reader(ser)
+	if not reader.packets:
+		reader.packets.extend(reader.read_packets())
+
+	# Take packets already read, up to max_packets.
+	if max_packets is None or max_packets >= len(reader.packets):
+		packets = list(reader.packets)
+		reader.packets.clear()
+	else:
+		packets = [reader.packets.popleft() for i in range(max_packets)]
+
+	return get_packets_counts(packets)
+
+
+# Get acceleration and angular velocity values from packet.
+def get_packet_values(packet, metres, radians):
 	# If packet valid.
 	if len(packet) in PACKET_LENGTHS:
-		# Print packet length.
-		# print("Length:", len(data))
-
-		# Print packet bytes.
-		# print("Data: ", end="")
-		# for byte in packet:
-			# print("{:3d}".format(byte) + " ", end="")
-		# print()
-
-		# Convert and normalise accelerometer bytes to get acceleration on each axis.
-		# Uses C types to achieve exact 8-bit/16-bit and signed/unsigned precision.
-		ax = ctypes.c_int16(ctypes.c_ushort(packet[10] << 8).value + ctypes.c_ushort(packet[9]).value).value / acc_norm
-		ay = ctypes.c_int16(ctypes.c_ushort(packet[12] << 8).value + ctypes.c_ushort(packet[11]).value).value / acc_norm
-		az = ctypes.c_int16(ctypes.c_ushort(packet[14] << 8).value + ctypes.c_ushort(packet[13]).value).value / acc_norm
-
-		# Convert and normalise gyrometer bytes to get angular velocity on each axis.
-		# Uses C types to achieve exact 8-bit/16-bit and signed/unsigned precision.
-		gx = ctypes.c_int16(ctypes.c_ushort(packet[16] << 8).value + ctypes.c_ushort(packet[15]).value).value * gyro_norm
-		gy = ctypes.c_int16(ctypes.c_ushort(packet[18] << 8).value + ctypes.c_ushort(packet[17]).value).value * gyro_norm
-		gz = ctypes.c_int16(ctypes.c_ushort(packet[20] << 8).value + ctypes.c_ushort(packet[19]).value).value * gyro_norm
-
-		# Print acceleration and angular velocity values.
-		# print("Acceleration: " + str(ax) + ", " + str(ay) + ", " + str(az))
-		# print("Angular Velocity: " + str(gx) + ", " + str(gy) + ", " + str(gz) + "\n")
-
-		return ax, ay, az, gx, gy, gz
+		acc_norm, gyro_norm = get_norms(metres, radians)
+
+		# Convert little-endian 16-bit signed accelerometer and gyrometer bytes.
+		ax, ay, az, gx, gy, gz = struct.unpack_from(PACKET_VALUES_FORMAT, packet, PACKET_VALUES_OFFSET)
+
+		# Normalise to get acceleration and angular velocity on each axis.
+		return ax / acc_norm, ay / acc_norm, az / acc_norm, gx * gyro_norm, gy * gyro_norm, gz * gyro_norm
 	else:
 		return ()
 
 
+# Get acceleration and angular velocity values from batch of packets as array of shape (N, 6).
+# Invalid packets are skipped.
+def get_packets_values(packets, metres, radians):
+	return scale_counts(get_packets_counts(packets), metres, radians)
+
+
+# Get accelerometer and gyrometer counts from batch of packets as array of shape (N, 6).
+# Invalid packets are skipped.
+def get_packets_counts(packets):
+	# View sensor values bytes of valid packets through structured type.
+	data = b"".join(packet[:PACKET_DTYPE.itemsize] for packet in packets if len(packet) in PACKET_LENGTHS)
+
+	return numpy.frombuffer(data, dtype=PACKET_DTYPE)["values"]
+
+
+# Normalise accelerometer and gyrometer counts of shape (N, 6) to get acceleration and angular velocity.
+def scale_counts(counts, metres, radians):
+	acc_norm, gyro_norm = get_norms(metres, radians)
+
+	# Acceleration is divided rather than multiplied by reciprocal to match get_packet_values exactly.
+	values = numpy.empty((len(counts), 6))
+	numpy.divide(counts[:, :3], acc_norm, out=values[:, :3])
+	numpy.multiply(counts[:, 3:], gyro_norm, out=values[:, 3:])
+
+	return values
+
+
 # Close named serial port.
 def close_serial_port(ser):
+	packet_readers.pop(ser, None)
+	returned_samples.pop(ser, None)
 	ser.close()
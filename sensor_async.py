@@ -0,0 +1,178 @@
+# imuPIN - sensor_async.py
+# Stuart McDaniel, 2016
+
+# asyncio versions of sensor sample reading, calibration, and acquisition.
+# Many sample sources can share one event loop without a thread per sensor.
+
+import orientation_filters
+import sensor
+import sensor_samples
+
+import asyncio
+import numpy
+
+# CONSTANTS.
+# Number of decoded batches buffered before reading from serial port pauses.
+QUEUE_BATCHES = 16
+# Seconds between checks for waiting bytes on serial ports without file descriptor.
+POLL_INTERVAL = 0.005
+
+
+# Asynchronous iterator of batches of acceleration and angular velocity values, as arrays of shape (N, 6).
+# Reads only bytes already waiting at serial port, so never blocks event loop. Reading pauses while max_batches batches
+# are waiting to be consumed, leaving bytes in serial port buffer. If event loop cannot wait for file descriptor (such as
+# Windows proactor event loop), serial port is read in thread instead. Error reading is raised by every later read.
+class AsyncSampleSource:
+	def __init__(self, ser, metres, radians, max_batches=QUEUE_BATCHES):
+		self.ser = ser
+		self.metres = metres
+		self.radians = radians
+		self.reader = sensor.get_packet_reader(ser)
+		self.batches = asyncio.Queue(maxsize=max_batches)
+		self.pending = None
+		self.fd = None
+		self.threaded = False
+		self.error = None
+		self.task = None
+
+	# Start reading from serial port.
+	def start(self):
+		# Wait for serial port file descriptor to be readable if possible, otherwise poll.
+		try:
+			self.fd = self.ser.fileno()
+		except (AttributeError, OSError):
+			self.fd = None
+
+		self.task = asyncio.get_running_loop().create_task(self.run())
+
+		return self
+
+	# Stop reading from serial port.
+	async def stop(self):
+		if self.task is not None:
+			self.task.cancel()
+			try:
+				await self.task
+			except asyncio.CancelledError:
+				pass
+			self.task = None
+
+	async def __aenter__(self):
+		return self.start()
+
+	async def __aexit__(self, exc_type, exc_value, traceback):
+		await self.stop()
+
+	def __aiter__(self):
+		return self
+
+	async def __anext__(self):
+		return await self.read()
+
+	# Read packets into batches until stopped or error reading.
+	async def run(self):
+		loop = asyncio.get_running_loop()
+		try:
+			while True:
+				await self.wait_readable()
+				if self.threaded:
+					# Blocking read in thread, so event loop is not blocked.
+					packets = await loop.run_in_executor(None, self.reader.read_packets)
+				else:
+					packets = self.reader.read_packets()
+				if packets:
+					# Waits while consumer is behind.
+					await self.batches.put(sensor.get_packets_values(packets, self.metres, self.radians))
+		except Exception as error:
+			# Wake waiting read, and keep error for later reads.
+			self.error = error
+			await self.batches.put(error)
+
+	# Wait until bytes waiting at serial port (or return at once if reading in thread).
+	async def wait_readable(self):
+		loop = asyncio.get_running_loop()
+		while not self.threaded and self.ser.in_waiting == 0:
+			if self.fd is None:
+				await asyncio.sleep(POLL_INTERVAL)
+			else:
+				readable = loop.create_future()
+				try:
+					loop.add_reader(self.fd, lambda: readable.done() or readable.set_result(None))
+				except NotImplementedError:
+					self.threaded = True
+					return
+				try:
+					await readable
+				finally:
+					loop.remove_reader(self.fd)
+
+	# Return values read but not used, array of shape (N, 6), to be read again before values waiting.
+	def unread(self, sensor_values):
+		if len(sensor_values) == 0:
+			return
+		if self.pending is not None:
+			sensor_values = numpy.concatenate((sensor_values, self.pending))
+		self.pending = sensor_values
+
+	# Get next batch of up to max_samples values. Values beyond max_samples are kept for next read.
+	async def read(self, max_samples=None):
+		if self.pending is not None:
+			batch = self.pending
+			self.pending = None
+		elif self.error is not None and self.batches.empty():
+			raise self.error
+		else:
+			batch = await self.batches.get()
+			if isinstance(batch, Exception):
+				raise batch
+
+		if max_samples is not None and len(batch) > max_samples:
+			self.pending = batch[max_samples:]
+			batch = batch[:max_samples]
+
+		return batch
+
+
+# Calibrate sensor by calculating orientation quaternion after number of samples.
+async def calibrate_sensor_time(source, q, samples, engine=None):
+	engine = orientation_filters.get_engine(engine)
+	count = 0
+	while count < samples:
+		sensor_values = await source.read(samples - count)
+		count += len(sensor_values)
+		q = sensor_samples.calibrate_sensor_time_batch(q, sensor_values, engine)
+
+	return q
+
+
+# Calibrate sensor by reading samples until gravity relatively constant.
+# If fast, calibration starts from orientation of first acceleration readings with high feedback gain that decays to
+# normal gain. If stats dictionary given, calibration statistics are added to it. Samples read after calibration are
+# returned to source, so next read (acquisition) gets them.
+async def calibrate_sensor_compare(source, q, engine=None, fast=True, stats=None):
+	calibration = sensor_samples.CompareCalibration(q, source.metres, engine, fast)
+
+	while not calibration.calibrated:
+		calibration.update(await source.read())
+	source.unread(calibration.remaining)
+
+	if stats is not None:
+		stats.update(calibration.stats())
+
+	return calibration.q
+
+
+# Get acceleration samples.
+# Returns raw acceleration, angular velocity, gravity, and acceleration as arrays of shape (3, N).
+async def get_acceleration(source, q, samples, engine=None):
+	sensor_values = numpy.empty((6, samples))
+	quaternions = numpy.empty((samples, 4))
+	engine = orientation_filters.get_engine(engine)
+
+	count = 0
+	while count < samples:
+		batch = await source.read(samples - count)
+		q = sensor_samples.get_acceleration_batch(q, batch, sensor_values, quaternions, count, engine)
+		count += len(batch)
+
+	return (q,) + sensor_samples.get_acceleration_arrays(sensor_values, quaternions, source.metres)
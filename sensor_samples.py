@@ -1,196 +1,369 @@
 # imuPIN - sensor_samples.py
 # Stuart McDaniel, 2016
 
-import madgwick
+import capture
+import orientation_filters
 import sensor
 import utils
 
+import math
+import numpy
 import scipy.constants
+import time
+
+# CONSTANTS.
+# Fast calibration starting feedback gain multiplier.
+CALIBRATION_GAIN = 10.0
+# Fast calibration feedback gain decay time constant in samples.
+CALIBRATION_GAIN_DECAY = 10.0
+# Fast calibration feedback gain multiplier below which gravity is compared.
+CALIBRATION_SETTLED_GAIN = 2.0
+# Number of samples filtered with same feedback gain multiplier.
+CALIBRATION_GAIN_STEP = 5
+# Number of samples of gravity that must be relatively constant for calibration.
+CALIBRATION_WINDOW = 10
+# Number of first acceleration readings averaged for fast calibration starting orientation.
+CALIBRATION_SEED_SAMPLES = 5
+# Acceleration magnitude (m/s^2) below which sensor may be stationary for zero-velocity updates.
+ZERO_VELOCITY_THRESHOLD = 0.1
+# Number of consecutive samples below threshold for sensor to be stationary.
+ZERO_VELOCITY_SAMPLES = 10
+
+
+# Get batch of up to max_samples acceleration and angular velocity values from serial port or capture.
+def get_sensor_values_batch(ser, max_samples, metres, radians):
+	returned = take_returned_samples(ser)
+	if returned is not None:
+		if max_samples is not None and len(returned) > max_samples:
+			return_samples(ser, returned[max_samples:])
+			returned = returned[:max_samples]
+		return returned
+
+	if isinstance(ser, capture.SerialCapture):
+		return ser.get_sensor_values_batch(metres, radians, max_samples)
+	else:
+		return sensor.get_sensor_values_batch(ser, metres, radians, max_samples)
+
+
+# Return sensor values read from serial port or capture but not used, array of shape (N, 6), to be read again first.
+def return_samples(ser, sensor_values):
+	if len(sensor_values):
+		sensor.returned_samples[ser] = sensor_values
+
+
+# Take sensor values returned for serial port or capture, or None.
+def take_returned_samples(ser):
+	return sensor.returned_samples.pop(ser, None)
 
 
 # Calibrate sensor by calculating orientation quaternion after number of samples.
-def calibrate_sensor_time(ser, q, samples, metres, radians):
-	# For each sample.
-	for i in range(samples):
-		# Get acceleration and angular velocity values from packet.
-		sensor_values = sensor.get_sensor_values(ser, metres, radians)
+def calibrate_sensor_time(ser, q, samples, metres, radians, engine=None):
+	engine = orientation_filters.get_engine(engine)
+	count = 0
+	while count < samples:
+		# Get batch of acceleration and angular velocity values from serial port or capture.
+		sensor_values = get_sensor_values_batch(ser, samples - count, metres, radians)
+		count += len(sensor_values)
+		q = calibrate_sensor_time_batch(q, sensor_values, engine)
+
+	return q
 
-		# If values valid.
-		if len(sensor_values) == 6:
-			ax, ay, az, gx, gy, gz = sensor_values
 
-			# Calculate orientation quaternion of sensor sample using previous quaternion.
-			q = madgwick.orientation_filter(q, (ax, ay, az), (gx, gy, gz))
+# Calibrate sensor with batch of samples. Engine should be same engine for every batch of samples from sensor.
+def calibrate_sensor_time_batch(q, sensor_values, engine=None):
+	# Calculate orientation quaternions of sensor samples using previous quaternion.
+	if len(sensor_values):
+		q = tuple(orientation_filters.get_engine(engine).filter_samples(q, sensor_values)[-1].tolist())
 
 	return q
 
 
 # Calibrate sensor by reading samples until gravity relatively constant.
-def calibrate_sensor_compare(ser, q, metres, radians):
-	raw_acceleration = [], [], []
-	angular_velocity = [], [], []
-	gravity = [], [], []
-
-	while True:
-		# Get acceleration and angular velocity values from packet.
-		sensor_values = sensor.get_sensor_values(ser, metres, radians)
-
-		# If values valid.
-		if len(sensor_values) == 6:
-			ax, ay, az, gx, gy, gz = sensor_values
-
-			# Append sensor values to raw acceleration and angular velocity lists.
-			raw_acceleration[0].append(ax)
-			raw_acceleration[1].append(ay)
-			raw_acceleration[2].append(az)
-			angular_velocity[0].append(gx)
-			angular_velocity[1].append(gy)
-			angular_velocity[2].append(gz)
-
-			# Calculate orientation quaternion of sensor sample using previous quaternion.
-			q = madgwick.orientation_filter(q, (gx, gy, gz), (ax, ay, az))
-
-			# Calculate gravity on sample using orientation quaternion.
-			q0, q1, q2, q3 = q
-			if metres:
-				gravity[0].append(2 * (q1 * q3 - q0 * q2) * scipy.constants.g)
-				gravity[1].append(2 * (q0 * q1 + q2 * q3) * scipy.constants.g)
-				gravity[2].append((q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3) * scipy.constants.g)
-			else:
-				gravity[0].append(2 * (q1 * q3 - q0 * q2))
-				gravity[1].append(2 * (q0 * q1 + q2 * q3))
-				gravity[2].append(q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3)
-
-		# Break if gravity relatively constant.
+# If fast, calibration starts from orientation of first acceleration readings with high feedback gain that decays to
+# normal gain, instead of from q with normal gain. If stats dictionary given, calibration statistics are added to it.
+# Samples read after calibration are returned to serial port or capture, so next read (acquisition) gets them.
+def calibrate_sensor_compare(ser, q, metres, radians, engine=None, fast=True, stats=None):
+	calibration = CompareCalibration(q, metres, engine, fast)
+
+	while not calibration.calibrated:
+		# Get batch of acceleration and angular velocity values from serial port or capture.
+		calibration.update(get_sensor_values_batch(ser, None, metres, radians))
+	return_samples(ser, calibration.remaining)
+
+	if stats is not None:
+		stats.update(calibration.stats())
+
+	return calibration.q
+
+
+# Calibration by reading samples until gravity relatively constant, updated one batch of samples at a time.
+class CompareCalibration:
+	def __init__(self, q, metres, engine=None, fast=True):
+		self.q = q
+		self.metres = metres
+		self.engine = orientation_filters.get_engine(engine)
+		self.fast = fast
+		self.calibrated = False
+		# Samples of last batch after calibration, not filtered.
+		self.remaining = numpy.zeros((0, 6))
+		# Samples filtered, and samples until calibrated.
+		self.samples = 0
+		self.calibration_samples = 0
+		self.start_time = time.perf_counter()
+		self.calibration_time = 0.0
+
+		# Gravity range for calibration.
 		if metres:
-			if len(gravity[0]) >= 10 and utils.list_within_range((gravity[0][-10:], gravity[1][-10:], gravity[2][-10:]), 0.04):
-				break
+			range_value = 0.04
 		else:
-			if len(gravity[0]) >= 10 and utils.list_within_range((gravity[0][-10:], gravity[1][-10:], gravity[2][-10:]),
-																 0.04 / scipy.constants.g):
-				break
-
-	return q
+			range_value = 0.04 / scipy.constants.g
+		self.detector = utils.StationarityDetector(CALIBRATION_WINDOW, range_value)
+
+	# Feedback gain multiplier for next sample.
+	def gain_scale(self):
+		if not self.fast:
+			return 1.0
+
+		return 1.0 + (CALIBRATION_GAIN - 1.0) * math.exp(-self.samples / CALIBRATION_GAIN_DECAY)
+
+	# Calibrate sensor with batch of samples. Returns whether gravity relatively constant.
+	# Filtering stops at sample calibration completes on, and later samples of batch are kept in remaining.
+	def update(self, sensor_values):
+		if len(sensor_values) == 0 or self.calibrated:
+			return self.calibrated
+
+		# Start from orientation of first acceleration readings.
+		if self.fast and self.samples == 0:
+			direction = numpy.mean(sensor_values[:CALIBRATION_SEED_SAMPLES, :3], axis=0, keepdims=True)
+			self.q = tuple(orientation_filters.get_tilt_quaternions(direction)[0].tolist())
+
+		# Filter samples in steps of constant gain.
+		for i in range(0, len(sensor_values), CALIBRATION_GAIN_STEP):
+			gain_scale = self.gain_scale()
+			quaternions = self.engine.filter_samples(self.q, sensor_values[i:i + CALIBRATION_GAIN_STEP], gain_scale)
+
+			# For each sample's gravity.
+			for j, sample_gravity in enumerate(get_gravity(quaternions, self.metres).tolist()):
+				self.calibration_samples += 1
+
+				# Calibrated if gravity relatively constant once feedback gain has settled.
+				if self.detector.update(sample_gravity) and gain_scale <= CALIBRATION_SETTLED_GAIN:
+					self.calibrated = True
+					self.calibration_time = time.perf_counter() - self.start_time
+					self.q = tuple(quaternions[j].tolist())
+					self.samples += j + 1
+					self.remaining = sensor_values[i + j + 1:]
+					return self.calibrated
+
+			self.q = tuple(quaternions[-1].tolist())
+			self.samples += len(quaternions)
+
+		return self.calibrated
+
+	# Get calibration statistics.
+	def stats(self):
+		return {
+			"calibrated": self.calibrated,
+			"samples": self.calibration_samples,
+			"seconds": self.calibration_time,
+			"fast": self.fast,
+			"engine": self.engine.name
+		}
 
 
 # Get acceleration samples.
-def get_acceleration(ser, q, samples, metres, radians):
-	raw_acceleration = [], [], []
-	angular_velocity = [], [], []
-	gravity = [], [], []
-	acceleration = [], [], []
-
-	# For each sample.
-	for i in range(samples):
-		# Get acceleration and angular velocity values from packet.
-		sensor_values = sensor.get_sensor_values(ser, metres, radians)
-
-		# If values valid.
-		if len(sensor_values) == 6:
-			ax, ay, az, gx, gy, gz = sensor_values
-
-			# Append sensor values to raw acceleration and angular velocity lists.
-			raw_acceleration[0].append(ax)
-			raw_acceleration[1].append(ay)
-			raw_acceleration[2].append(az)
-			angular_velocity[0].append(gx)
-			angular_velocity[1].append(gy)
-			angular_velocity[2].append(gz)
-
-			# Calculate orientation quaternion of sensor sample using previous quaternion.
-			q = madgwick.orientation_filter(q, (gx, gy, gz), (ax, ay, az))
-
-			# Calculate gravity on sample using orientation quaternion.
-			q0, q1, q2, q3 = q
-			if metres:
-				gravity[0].append(2 * (q1 * q3 - q0 * q2) * scipy.constants.g)
-				gravity[1].append(2 * (q0 * q1 + q2 * q3) * scipy.constants.g)
-				gravity[2].append((q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3) * scipy.constants.g)
-			else:
-				gravity[0].append(2 * (q1 * q3 - q0 * q2))
-				gravity[1].append(2 * (q0 * q1 + q2 * q3))
-				gravity[2].append(q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3)
-
-			# Remove gravity from raw acceleration.
-			acceleration[0].append(raw_acceleration[0][-1] - gravity[0][-1])
-			acceleration[1].append(raw_acceleration[1][-1] - gravity[1][-1])
-			acceleration[2].append(raw_acceleration[2][-1] - gravity[2][-1])
-
-	return q, raw_acceleration, angular_velocity, gravity, acceleration
+# Returns raw acceleration, angular velocity, gravity, and acceleration as arrays of shape (3, N).
+def get_acceleration(ser, q, samples, metres, radians, engine=None):
+	# Preallocate sensor values, one row per axis, and orientation quaternions.
+	sensor_values = numpy.empty((6, samples))
+	quaternions = numpy.empty((samples, 4))
+	engine = orientation_filters.get_engine(engine)
+
+	count = 0
+	while count < samples:
+		# Get batch of acceleration and angular velocity values from serial port or capture.
+		batch = get_sensor_values_batch(ser, samples - count, metres, radians)
+		q = get_acceleration_batch(q, batch, sensor_values, quaternions, count, engine)
+		count += len(batch)
+
+	return (q,) + get_acceleration_arrays(sensor_values, quaternions, metres)
+
+
+# Filter batch of samples into preallocated sensor values array of shape (6, N) and quaternions array of shape (N, 4)
+# from position. Engine should be same engine for every batch of samples from sensor.
+def get_acceleration_batch(q, batch, sensor_values, quaternions, position, engine=None):
+	if len(batch) == 0:
+		return q
+
+	sensor_values[:, position:position + len(batch)] = batch.T
+
+	# Calculate orientation quaternions of sensor samples using previous quaternion.
+	quaternions[position:position + len(batch)] = orientation_filters.get_engine(engine).filter_samples(q, batch)
+
+	return tuple(quaternions[position + len(batch) - 1].tolist())
+
+
+# Split sensor values array of shape (6, N) and quaternions array of shape (N, 4) into raw acceleration, angular
+# velocity, gravity, and acceleration arrays of shape (3, N). Raw acceleration and angular velocity are views.
+def get_acceleration_arrays(sensor_values, quaternions, metres):
+	raw_acceleration = sensor_values[:3]
+	angular_velocity = sensor_values[3:]
+
+	# Calculate gravity on samples using orientation quaternions, and remove from raw acceleration.
+	gravity = numpy.ascontiguousarray(get_gravity(quaternions, metres).T)
+	acceleration = raw_acceleration - gravity
+
+	return raw_acceleration, angular_velocity, gravity, acceleration
+
+
+# Calculate gravity on samples using orientation quaternions array of shape (..., 4). Returns array of shape (..., 3).
+def get_gravity(q, metres):
+	q0, q1, q2, q3 = numpy.moveaxis(q, -1, 0)
+	gravity = numpy.stack((2 * (q1 * q3 - q0 * q2), 2 * (q0 * q1 + q2 * q3), q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3),
+			axis=-1)
+	if metres:
+		gravity *= scipy.constants.g
+
+	return gravity
 
 
 # Double integrate acceleration samples to get displacement samples.
-def get_displacement(acceleration):
-	velocity_change = [], [], []
-	velocity = [0.0], [0.0], [0.0]
-	displacement_change = [], [], []
-	displacement = [0.0], [0.0], [0.0]
-
-	# For each acceleration sample.
-	for i in range(len(acceleration[0])):
-		# Get change in velocity during sample. Change in v = a * t.
-		velocity_change[0].append(acceleration[0][-1] * (1 / utils.SAMPLE_FREQ))
-		velocity_change[1].append(acceleration[1][-1] * (1 / utils.SAMPLE_FREQ))
-		velocity_change[2].append(acceleration[2][-1] * (1 / utils.SAMPLE_FREQ))
-
-		# Calculate change in velocity's effect on overall velocity.
-		velocity[0].append(velocity_change[0][-1] + velocity[0][-1])
-		velocity[1].append(velocity_change[1][-1] + velocity[1][-1])
-		velocity[2].append(velocity_change[2][-1] + velocity[2][-1])
-
-		# Get change in displacement during sample. Change in d = v * t.
-		displacement_change[0].append(velocity[0][-1] * (1 / utils.SAMPLE_FREQ))
-		displacement_change[1].append(velocity[1][-1] * (1 / utils.SAMPLE_FREQ))
-		displacement_change[2].append(velocity[2][-1] * (1 / utils.SAMPLE_FREQ))
-
-		# Calculate change in displacement's effect on overall displacement.
-		displacement[0].append(displacement_change[0][-1] + displacement[0][-1])
-		displacement[1].append(displacement_change[1][-1] + displacement[1][-1])
-		displacement[2].append(displacement_change[2][-1] + displacement[2][-1])
-
-	# Remove dummy values.
-	velocity[0].pop(0)
-	velocity[1].pop(0)
-	velocity[2].pop(0)
-	displacement[0].pop(0)
-	displacement[1].pop(0)
-	displacement[2].pop(0)
-
-	return velocity_change, velocity, displacement_change, displacement
+# Returns velocity change, velocity, displacement change, and displacement as arrays of shape (3, N).
+# If zero_velocity, velocity is reset to zero while sensor stationary. Acceleration is in m/s^2 if metres, otherwise g.
+def get_displacement(acceleration, zero_velocity=False, metres=True):
+	return DisplacementIntegrator(zero_velocity, metres).update(acceleration)
+
+
+# Streaming double integration of acceleration samples, keeping velocity and displacement between chunks.
+# If zero_velocity, velocity drift is corrected by resetting velocity to zero once acceleration magnitude has been below
+# threshold for ZERO_VELOCITY_SAMPLES samples (zero-velocity update). Acceleration is in m/s^2 if metres, otherwise g,
+# and threshold (default ZERO_VELOCITY_THRESHOLD) is in m/s^2.
+class DisplacementIntegrator:
+	def __init__(self, zero_velocity=False, metres=True, threshold=ZERO_VELOCITY_THRESHOLD):
+		self.zero_velocity = zero_velocity
+		if metres:
+			self.threshold = threshold
+		else:
+			self.threshold = threshold / scipy.constants.g
+		self.velocity = numpy.zeros(3)
+		self.displacement = numpy.zeros(3)
+		# Number of consecutive stationary samples at end of previous chunk.
+		self.stationary_samples = 0
+
+	# Double integrate chunk of acceleration samples, array of shape (3, N).
+	# Returns velocity change, velocity, displacement change, and displacement as arrays of shape (3, N).
+	def update(self, acceleration):
+		acceleration = numpy.asarray(acceleration, dtype=float).reshape(3, -1)
+		samples = acceleration.shape[1]
+
+		# Get change in velocity during each sample. Change in v = a * t.
+		velocity_change = acceleration * (1 / utils.SAMPLE_FREQ)
+		velocity = numpy.cumsum(velocity_change, axis=1)
+
+		# Reset velocity to zero at stationary samples, and integrate from last reset.
+		resets = numpy.full(samples, -1)
+		if self.zero_velocity and samples:
+			resets = self.get_resets(acceleration)
+		velocity += self.velocity[:, numpy.newaxis]
+		reset = resets >= 0
+		velocity[:, reset] -= velocity[:, resets[reset]]
+
+		# Get change in displacement during each sample. Change in d = v * t.
+		displacement_change = velocity * (1 / utils.SAMPLE_FREQ)
+		displacement = numpy.cumsum(displacement_change, axis=1) + self.displacement[:, numpy.newaxis]
+
+		if samples:
+			self.velocity = velocity[:, -1].copy()
+			self.displacement = displacement[:, -1].copy()
+
+		return velocity_change, velocity, displacement_change, displacement
+
+	# Get index of last zero-velocity sample at or before each sample, or -1.
+	def get_resets(self, acceleration):
+		samples = acceleration.shape[1]
+		indexes = numpy.arange(samples)
+
+		# Number of consecutive samples with acceleration below threshold, continuing from previous chunk.
+		moving = numpy.sqrt(numpy.sum(acceleration * acceleration, axis=0)) >= self.threshold
+		last_moving = numpy.maximum.accumulate(numpy.where(moving, indexes, -1 - self.stationary_samples))
+		stationary_samples = indexes - last_moving
+		self.stationary_samples = int(stationary_samples[-1])
+
+		# Last zero-velocity sample.
+		zero = stationary_samples >= ZERO_VELOCITY_SAMPLES
+
+		return numpy.maximum.accumulate(numpy.where(zero, indexes, -1))
 
 
 # Quantise acceleration samples (temporal compression).
+# Returns array of shape (3, N), with average of each sliding window, including partly filled windows at end.
 def quantise_compress(acceleration):
-	# Average acceleration samples using sliding window.
-	compressed = [], [], []
-	for i in range(len(acceleration[0])):
-		if i % utils.WINDOW_SLIDE == 0:
-			compressed[0].append(sum(acceleration[0][i:i + utils.WINDOW_SIZE]) / utils.WINDOW_SIZE)
-			compressed[1].append(sum(acceleration[1][i:i + utils.WINDOW_SIZE]) / utils.WINDOW_SIZE)
-			compressed[2].append(sum(acceleration[2][i:i + utils.WINDOW_SIZE]) / utils.WINDOW_SIZE)
+	compressor = StreamingCompressor()
+	compressed = compressor.update(acceleration)
+
+	return numpy.concatenate((compressed, compressor.flush()), axis=1)
+
+
+# Streaming temporal compression of acceleration samples. Each window's average is returned as soon as all its samples
+# are given, so later stages can run while samples are captured.
+class StreamingCompressor:
+	def __init__(self):
+		# Samples from start of next window.
+		self.samples = numpy.zeros((3, 0))
+		# Samples still to be skipped before start of next window (if windows slide further than their size).
+		self.skip = 0
 
-	return compressed
+	# Add chunk of acceleration samples, array of shape (3, N).
+	# Returns averages of windows completed, array of shape (3, M).
+	def update(self, acceleration):
+		acceleration = numpy.asarray(acceleration, dtype=float).reshape(3, -1)
+		skip = min(self.skip, acceleration.shape[1])
+		self.skip -= skip
+		self.samples = numpy.concatenate((self.samples, acceleration[:, skip:]), axis=1)
+
+		# Number of windows with all samples given.
+		windows = max((self.samples.shape[1] - utils.WINDOW_SIZE) // utils.WINDOW_SLIDE + 1, 0)
+
+		return self.compress_windows(windows)
+
+	# Get averages of windows started but not completed, treating missing samples as zero, and reset compressor.
+	# Returns array of shape (3, M).
+	def flush(self):
+		windows = -(-self.samples.shape[1] // utils.WINDOW_SLIDE)
+		compressed = self.compress_windows(windows)
+		self.samples = numpy.zeros((3, 0))
+		self.skip = 0
+
+		return compressed
+
+	# Average first number of windows of samples, and remove samples before start of next window.
+	def compress_windows(self, windows):
+		span = (windows - 1) * utils.WINDOW_SLIDE + utils.WINDOW_SIZE
+		padded = numpy.zeros((3, max(span, self.samples.shape[1])))
+		padded[:, :self.samples.shape[1]] = self.samples
+
+		# Sum window samples in order, so averages match summing each window separately.
+		compressed = numpy.zeros((3, windows))
+		for offset in range(utils.WINDOW_SIZE):
+			compressed += padded[:, offset:offset + windows * utils.WINDOW_SLIDE:utils.WINDOW_SLIDE]
+		compressed /= utils.WINDOW_SIZE
+
+		consumed = windows * utils.WINDOW_SLIDE
+		self.skip += max(consumed - self.samples.shape[1], 0)
+		self.samples = self.samples[:, consumed:]
+
+		return compressed
 
 
 # Quantise acceleration samples (non-linear conversion).
-def quantise_discrete(acceleration):
+# Returns array of shape (3, N) of integers, or of 8-bit integers if compact.
+def quantise_discrete(acceleration, compact=False):
+	acceleration = numpy.asarray(acceleration, dtype=float).reshape(3, -1)
+
 	# Convert each acceleration sample into one of 33 levels (-16 to 16).
-	discrete = [], [], []
-	for i in range(3):
-		for j in range(len(acceleration[i])):
-			if acceleration[i][j] > 2:
-				discrete[i].append(16)
-			elif acceleration[i][j] > 1:
-				discrete[i].append(round((acceleration[i][j] - 1) * 5) + 10)
-			elif acceleration[i][j] > 0:
-				discrete[i].append(round(acceleration[i][j] * 10))
-			elif acceleration[i][j] == 0:
-				discrete[i].append(0)
-			elif acceleration[i][j] > -1:
-				discrete[i].append(round(acceleration[i][j] * 10))
-			elif acceleration[i][j] > -2:
-				discrete[i].append(round((acceleration[i][j] + 1) * 5) - 10)
-			else:
-				discrete[i].append(-16)
-
-	return discrete
+	# numpy.round rounds halves to even, as round does.
+	discrete = numpy.select((acceleration > 2, acceleration > 1, acceleration > -1, acceleration > -2),
+			(16, numpy.round((acceleration - 1) * 5) + 10, numpy.round(acceleration * 10),
+			numpy.round((acceleration + 1) * 5) - 10), -16)
+
+	return discrete.astype(numpy.int8 if compact else int)
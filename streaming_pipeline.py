@@ -0,0 +1,167 @@
+# imuPIN - streaming_pipeline.py
+# Stuart McDaniel, 2016
+
+# Streaming classification pipeline. Each batch of samples read passes through orientation filtering, gravity removal,
+# temporal compression, peak detection, and segmentation as it arrives, and candidates are produced as soon as a PIN
+# entry segment's last peak is confirmed, instead of after fixed number of samples has been recorded. Segments found
+# in same batch are classified together, in one classification.
+
+import orientation_filters
+import pattern_recognition
+import sensor_samples
+
+import numpy
+import time
+
+# CONSTANTS.
+# Number of compressed samples kept for segmentation (12 seconds at 100 Hz). PIN entry segments must fit.
+PIPELINE_HISTORY = 400
+
+
+# Streaming pipeline from sensor samples to candidate PIN entry segments.
+# Each candidate is dictionary of compressed sample range of segment ("start", "end"), transition directions
+# ("transitions"), and seconds from arrival of samples of last keystroke peak to result ("latency"). PINs matching
+# candidates are found with pins.get_matching_pins_segments.
+class StreamingPipeline:
+	def __init__(self, q, metres=False, radians=True, engine=None, k=5):
+		self.q = q
+		self.metres = metres
+		self.radians = radians
+		self.engine = orientation_filters.get_engine(engine)
+		self.k = k
+		self.compressor = sensor_samples.StreamingCompressor()
+		self.peak_detector = pattern_recognition.OnlinePeakDetector()
+
+		# Recent compressed samples, and time batch completing each was read.
+		self.compressed = numpy.zeros((3, 0))
+		self.times = numpy.zeros(0)
+		# Compressed sample number of first sample kept.
+		self.offset = 0
+		# Confirmed z-axis peaks (compressed sample numbers), last four kept.
+		self.peaks = []
+
+		# Counters.
+		self.samples = 0
+		self.peaks_found = 0
+		self.segments = 0
+		self.candidates = []
+
+	# Read samples from serial port or capture and process them until number of samples (or forever if None).
+	# Yields candidates as they are found, including those found at end of samples.
+	def run(self, ser, samples=None):
+		for candidates in self.run_batches(ser, samples):
+			yield from candidates
+
+	# Read samples from serial port or capture and process them until number of samples (or forever if None).
+	# Yields lists of candidates found in same batch of samples, classified together, including those found at end of
+	# samples.
+	def run_batches(self, ser, samples=None):
+		count = 0
+		while samples is None or count < samples:
+			max_samples = None if samples is None else samples - count
+			batch = sensor_samples.get_sensor_values_batch(ser, max_samples, self.metres, self.radians)
+			count += len(batch)
+			candidates = self.process(batch)
+			if candidates:
+				yield candidates
+
+		candidates = self.finish()
+		if candidates:
+			yield candidates
+
+	# Process batch of acceleration and angular velocity values, array of shape (N, 6), read at read_time.
+	# Returns list of candidates found.
+	def process(self, batch, read_time=None):
+		if read_time is None:
+			read_time = time.perf_counter()
+		if len(batch) == 0:
+			return []
+		self.samples += len(batch)
+
+		# Orientation filtering and gravity removal.
+		sensor_values = numpy.empty((6, len(batch)))
+		quaternions = numpy.empty((len(batch), 4))
+		self.q = sensor_samples.get_acceleration_batch(self.q, batch, sensor_values, quaternions, 0, self.engine)
+		acceleration = sensor_samples.get_acceleration_arrays(sensor_values, quaternions, self.metres)[3]
+
+		# Temporal compression and peak detection.
+		compressed = self.compressor.update(acceleration)
+
+		return self.add_compressed(compressed, read_time, self.peak_detector.update(compressed[2]))
+
+	# Process partly filled windows at end of samples, and confirm remaining peaks.
+	# Returns list of candidates found.
+	def finish(self):
+		compressed = self.compressor.flush()
+		# Final partly filled windows may confirm peaks before remaining peaks are confirmed.
+		peaks = numpy.concatenate((self.peak_detector.update(compressed[2]), self.peak_detector.flush()))
+
+		return self.add_compressed(compressed, time.perf_counter(), peaks)
+
+	# Add compressed samples, and segment and classify at peaks confirmed.
+	def add_compressed(self, compressed, read_time, peaks):
+		self.compressed = numpy.concatenate((self.compressed, compressed), axis=1)
+		self.times = numpy.concatenate((self.times, numpy.full(compressed.shape[1], read_time)))
+
+		# Forget samples before history.
+		start = self.compressed.shape[1] - PIPELINE_HISTORY
+		if start > 0:
+			self.compressed = self.compressed[:, start:]
+			self.times = self.times[start:]
+			self.offset += start
+
+		segments = []
+		for peak in peaks:
+			self.peaks = self.peaks[-3:] + [int(peak)]
+			self.peaks_found += 1
+			segments.extend(self.segment())
+
+		return self.classify(segments)
+
+	# Segment PIN entry acceleration ending at last peak.
+	# Returns list of segment as (start, end, time samples of last peak were read), or empty list if last four peaks are
+	# not PIN entry.
+	def segment(self):
+		starts, ends = pattern_recognition.find_segments(self.peaks)
+		if len(starts) == 0 or starts[0] < self.offset:
+			return []
+		self.segments += 1
+
+		return [(int(starts[0]), int(ends[0]), float(self.times[self.peaks[3] - self.offset]))]
+
+	# Extract and classify key transition features of segments together.
+	# Returns list of candidates, for segments with enough features.
+	def classify(self, segments):
+		if len(segments) == 0:
+			return []
+
+		segments_transitions = pattern_recognition.classify_segments(
+				[self.compressed[:, start - self.offset:end - self.offset] for start, end, peak_time in segments], self.k)
+		classify_time = time.perf_counter()
+
+		candidates = []
+		for (start, end, peak_time), transitions in zip(segments, segments_transitions):
+			if transitions is not None:
+				candidates.append({
+					"start": start,
+					"end": end,
+					"transitions": [str(transition) for transition in transitions],
+					"latency": classify_time - peak_time
+				})
+		self.candidates.extend(candidates)
+
+		return candidates
+
+	# Get pipeline counters.
+	def stats(self):
+		latencies = [candidate["latency"] for candidate in self.candidates]
+
+		return {
+			"samples": self.samples,
+			"compressed": self.offset + self.compressed.shape[1],
+			"peaks": self.peaks_found,
+			"segments": self.segments,
+			"candidates": len(self.candidates),
+			"mean_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+			"max_latency": max(latencies, default=0.0)
+		}
@@ -0,0 +1,120 @@
+# imuPIN - test_madgwick.py
+# Stuart McDaniel, 2016
+
+import madgwick
+import utils
+
+import numpy
+
+# CONSTANTS.
+# Largest difference between quaternion components and reference.
+TOLERANCE = 1e-9
+
+
+# Calculate orientation quaternion of sensor sample using previous quaternion, as before batch engines.
+def reference_filter(q, ang, acc):
+	q0, q1, q2, q3 = q
+	gx, gy, gz = ang
+	ax, ay, az = acc
+
+	q_dot_1 = 0.5 * (-q1 * gx - q2 * gy - q3 * gz)
+	q_dot_2 = 0.5 * (q0 * gx + q2 * gz - q3 * gy)
+	q_dot_3 = 0.5 * (q0 * gy - q1 * gz + q3 * gx)
+	q_dot_4 = 0.5 * (q0 * gz + q1 * gy - q2 * gx)
+
+	if not ((ax == 0.0) and (ay == 0.0) and (az == 0.0)):
+		recip_norm = (ax * ax + ay * ay + az * az) ** (-0.5)
+		ax *= recip_norm
+		ay *= recip_norm
+		az *= recip_norm
+
+		_2q0 = 2.0 * q0
+		_2q1 = 2.0 * q1
+		_2q2 = 2.0 * q2
+		_2q3 = 2.0 * q3
+		_4q0 = 4.0 * q0
+		_4q1 = 4.0 * q1
+		_4q2 = 4.0 * q2
+		_8q1 = 8.0 * q1
+		_8q2 = 8.0 * q2
+		q0q0 = q0 * q0
+		q1q1 = q1 * q1
+		q2q2 = q2 * q2
+		q3q3 = q3 * q3
+
+		s0 = _4q0 * q2q2 + _2q2 * ax + _4q0 * q1q1 - _2q1 * ay
+		s1 = _4q1 * q3q3 - _2q3 * ax + 4.0 * q0q0 * q1 - _2q0 * ay - _4q1 + _8q1 * q1q1 + _8q1 * q2q2 + _4q1 * az
+		s2 = 4.0 * q0q0 * q2 + _2q0 * ax + _4q2 * q3q3 - _2q3 * ay - _4q2 + _8q2 * q1q1 + _8q2 * q2q2 + _4q2 * az
+		s3 = 4.0 * q1q1 * q3 - _2q1 * ax + 4.0 * q2q2 * q3 - _2q2 * ay
+
+		recip_norm = (s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3) ** (-0.5)
+		s0 *= recip_norm
+		s1 *= recip_norm
+		s2 *= recip_norm
+		s3 *= recip_norm
+
+		q_dot_1 -= madgwick.BETA_GAIN * s0
+		q_dot_2 -= madgwick.BETA_GAIN * s1
+		q_dot_3 -= madgwick.BETA_GAIN * s2
+		q_dot_4 -= madgwick.BETA_GAIN * s3
+
+	q0 += q_dot_1 * (1.0 / utils.SAMPLE_FREQ)
+	q1 += q_dot_2 * (1.0 / utils.SAMPLE_FREQ)
+	q2 += q_dot_3 * (1.0 / utils.SAMPLE_FREQ)
+	q3 += q_dot_4 * (1.0 / utils.SAMPLE_FREQ)
+
+	recip_norm = (q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3) ** (-1/2)
+	q0 *= recip_norm
+	q1 *= recip_norm
+	q2 *= recip_norm
+	q3 *= recip_norm
+
+	return q0, q1, q2, q3
+
+
+# Get reference quaternions of recording of samples, array of shape (N, 6), starting from quaternion.
+def get_reference_quaternions(q, sensor_values):
+	quaternions = []
+	for values in sensor_values:
+		q = reference_filter(q, values[3:], values[:3])
+		quaternions.append(q)
+
+	return numpy.array(quaternions).reshape(-1, 4)
+
+
+# Get random recording of samples with acceleration (g) near gravity and angular velocity (rad/s), including sample
+# with no acceleration.
+def get_recording(random_state, length):
+	sensor_values = numpy.hstack((random_state.normal((0, 0, 1), 0.3, (length, 3)),
+			random_state.normal(0, 1, (length, 3))))
+	sensor_values[length // 2, :3] = 0
+
+	return sensor_values
+
+
+# Recording engine's quaternions are reference quaternions.
+def test_samples_match_reference():
+	random_state = numpy.random.RandomState(0)
+	q = (1, 0, 0, 0)
+	sensor_values = get_recording(random_state, 500)
+
+	quaternions = madgwick.orientation_filter_samples(q, sensor_values)
+
+	assert quaternions.shape == (500, 4)
+	assert numpy.max(numpy.abs(quaternions - get_reference_quaternions(q, sensor_values))) < TOLERANCE
+
+
+# Lockstep engine's quaternions of recordings of different lengths are reference quaternions, repeating last.
+def test_recordings_match_reference():
+	random_state = numpy.random.RandomState(0)
+	q = random_state.normal(0, 1, (3, 4))
+	q /= numpy.linalg.norm(q, axis=1, keepdims=True)
+	sensor_values = numpy.array([get_recording(random_state, 200) for i in range(3)])
+	lengths = numpy.array([200, 120, 1])
+
+	quaternions = madgwick.orientation_filter_recordings(q, sensor_values, lengths)
+
+	for i, length in enumerate(lengths):
+		reference = get_reference_quaternions(tuple(q[i]), sensor_values[i, :length])
+		assert numpy.max(numpy.abs(quaternions[i, :length] - reference)) < TOLERANCE
+		assert (quaternions[i, length:] == quaternions[i, length - 1]).all()
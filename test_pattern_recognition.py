@@ -0,0 +1,78 @@
+# imuPIN - test_pattern_recognition.py
+# Stuart McDaniel, 2016
+
+import pattern_recognition
+import utils
+
+import numpy
+import scipy.interpolate
+
+
+# Change number of samples in feature using linear interpolation, as before all features were resampled together.
+def reference_resample(feature, new_size):
+	sample_numbers = range(len(feature[0]))
+	resampled_feature = [], [], []
+	for i in range(3):
+		function = scipy.interpolate.interp1d(sample_numbers, feature[i])
+		for j in range(new_size):
+			resampled_feature[i].append(float(function(j / (new_size - 1) * (len(feature[i]) - 1))))
+
+	return resampled_feature
+
+
+# Get synthetic z-axis acceleration of 4 to 6 keystrokes after quiet stretch, with noise of standard deviation.
+# Returns acceleration and sample numbers of keystrokes.
+def get_recording(random_state, noise):
+	keystrokes = random_state.randint(4, 7)
+	first = random_state.randint(30, 150)
+	acceleration = random_state.normal(0, noise, first + 20 * keystrokes + random_state.randint(30, 120))
+	times = first + 20 * numpy.arange(keystrokes) + random_state.randint(-2, 3, keystrokes)
+	samples = numpy.arange(len(acceleration))
+	for time in times:
+		acceleration += random_state.uniform(0.4, 0.8) * numpy.exp(-0.5 * ((samples - time) / random_state.uniform(1.5,
+				3)) ** 2)
+
+	return acceleration, times
+
+
+# Get peaks found by online peak detector from acceleration given in random chunks.
+def get_online_peaks(acceleration, random_state):
+	detector = pattern_recognition.OnlinePeakDetector()
+	peaks = []
+	for chunk in numpy.array_split(acceleration, random_state.randint(1, 30)):
+		peaks += list(detector.update(chunk))
+
+	return peaks + list(detector.flush())
+
+
+# Online peaks are find_peaks' peaks, and first segment starts at keystrokes, not noise before them.
+def test_online_peaks_match_find_peaks():
+	random_state = numpy.random.RandomState(0)
+	similarities = []
+	for i in range(100):
+		acceleration, times = get_recording(random_state, 0.03)
+		peaks = list(pattern_recognition.find_peaks([acceleration], 0))
+		online_peaks = get_online_peaks(acceleration, random_state)
+		similarities.append(len(set(peaks) & set(online_peaks)) / len(set(peaks) | set(online_peaks)))
+
+		starts, ends = pattern_recognition.find_segments(online_peaks)
+		assert starts[0] >= times[0] - 5
+
+	assert numpy.mean(similarities) >= 0.95
+
+
+# Noise alone has no online peaks.
+def test_online_peaks_reject_noise():
+	random_state = numpy.random.RandomState(0)
+	for noise in (0.01, 0.03, 0.1):
+		assert get_online_peaks(random_state.normal(0, noise, 1000), random_state) == []
+
+
+# Features of any length resampled together are identical to reference.
+def test_resample_matches_reference():
+	random_state = numpy.random.RandomState(0)
+	features = [random_state.normal(0, 1, (3, length)) for length in (2, 3, 7, 29, 30, 31, 64)]
+	resampled = pattern_recognition.resample_features(features, utils.FEATURE_SIZE)
+
+	assert resampled.tolist() == [[list(axis) for axis in reference_resample(feature.tolist(), utils.FEATURE_SIZE)]
+			for feature in features]
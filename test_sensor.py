@@ -0,0 +1,69 @@
+# imuPIN - test_sensor.py
+# Stuart McDaniel, 2016
+
+import sensor
+
+import ctypes
+import math
+import numpy
+import scipy.constants
+
+
+# Get acceleration and angular velocity values from packet, as read one byte at a time before packet batches.
+def get_reference_values(packet, metres, radians):
+	if metres:
+		acc_norm = 4096.0 / scipy.constants.g
+	else:
+		acc_norm = 4096.0
+	if radians:
+		gyro_norm = math.radians(0.07)
+	else:
+		gyro_norm = 0.07
+
+	if len(packet) in sensor.PACKET_LENGTHS:
+		# Uses C types to achieve exact 8-bit/16-bit and signed/unsigned precision.
+		counts = [ctypes.c_int16(ctypes.c_ushort(packet[i + 1] << 8).value + ctypes.c_ushort(packet[i]).value).value
+				for i in range(9, 21, 2)]
+		ax, ay, az = [count / acc_norm for count in counts[:3]]
+		gx, gy, gz = [count * gyro_norm for count in counts[3:]]
+
+		return ax, ay, az, gx, gy, gz
+	else:
+		return ()
+
+
+# Get random unescaped packets of length, including smallest and largest sensor values.
+def get_packets(random_state, length):
+	packets = []
+	for i in range(50):
+		packet = bytearray(random_state.randint(0, 256, length, dtype=numpy.uint8).tobytes())
+		packet[:2] = bytes([sensor.SLIP_END, sensor.SECOND])
+		packet[-1] = sensor.SLIP_END
+		packets.append(bytes(packet))
+	packets[0] = packets[0][:9] + bytes([0x00, 0x80, 0xff, 0x7f, 0xff, 0xff] * 2) + packets[0][21:]
+
+	return packets
+
+
+# Packets of both lengths are decoded one at a time and in batches exactly as before, in every unit.
+def test_packet_values_match_reference():
+	random_state = numpy.random.RandomState(0)
+	for length in sensor.PACKET_LENGTHS:
+		packets = get_packets(random_state, length)
+		for metres in (False, True):
+			for radians in (False, True):
+				reference = [get_reference_values(packet, metres, radians) for packet in packets]
+
+				assert [sensor.get_packet_values(packet, metres, radians) for packet in packets] == reference
+				assert sensor.get_packets_values(packets, metres, radians).tolist() == [list(values) for values in
+						reference]
+
+
+# Packets of other lengths are skipped.
+def test_invalid_packets_skipped():
+	packets = get_packets(numpy.random.RandomState(0), 28)
+	batch = [packets[0], packets[1][:20], packets[2] + b"\x00", packets[3]]
+
+	assert sensor.get_packet_values(batch[1], True, True) == ()
+	assert sensor.get_packets_values(batch, True, True).tolist() == [list(get_reference_values(packet, True, True))
+			for packet in (packets[0], packets[3])]
@@ -0,0 +1,72 @@
+# imuPIN - test_sensor_samples.py
+# Stuart McDaniel, 2016
+
+import sensor_samples
+import utils
+
+import numpy
+
+
+# Temporally compress acceleration samples, as before streaming compressor.
+def reference_compress(acceleration):
+	compressed = [], [], []
+	for i in range(len(acceleration[0])):
+		if i % utils.WINDOW_SLIDE == 0:
+			compressed[0].append(sum(acceleration[0][i:i + utils.WINDOW_SIZE]) / utils.WINDOW_SIZE)
+			compressed[1].append(sum(acceleration[1][i:i + utils.WINDOW_SIZE]) / utils.WINDOW_SIZE)
+			compressed[2].append(sum(acceleration[2][i:i + utils.WINDOW_SIZE]) / utils.WINDOW_SIZE)
+
+	return compressed
+
+
+# Quantise acceleration samples one at a time, as before arrays.
+def reference_discrete(acceleration):
+	discrete = [], [], []
+	for i in range(3):
+		for j in range(len(acceleration[i])):
+			if acceleration[i][j] > 2:
+				discrete[i].append(16)
+			elif acceleration[i][j] > 1:
+				discrete[i].append(round((acceleration[i][j] - 1) * 5) + 10)
+			elif acceleration[i][j] > 0:
+				discrete[i].append(round(acceleration[i][j] * 10))
+			elif acceleration[i][j] == 0:
+				discrete[i].append(0)
+			elif acceleration[i][j] > -1:
+				discrete[i].append(round(acceleration[i][j] * 10))
+			elif acceleration[i][j] > -2:
+				discrete[i].append(round((acceleration[i][j] + 1) * 5) - 10)
+			else:
+				discrete[i].append(-16)
+
+	return discrete
+
+
+# Compressed samples are identical to reference for every number of samples, whole or in chunks.
+def test_compress_matches_reference():
+	random_state = numpy.random.RandomState(0)
+	for length in range(0, 40):
+		acceleration = random_state.normal(0, 1, (3, length))
+		reference = reference_compress(acceleration.tolist())
+
+		assert sensor_samples.quantise_compress(acceleration).tolist() == [list(axis) for axis in reference]
+
+		compressor = sensor_samples.StreamingCompressor()
+		chunks = [compressor.update(chunk) for chunk in numpy.array_split(acceleration, random_state.randint(1, 8),
+				axis=1)]
+		compressed = numpy.concatenate(chunks + [compressor.flush()], axis=1)
+		assert compressed.tolist() == [list(axis) for axis in reference]
+
+
+# Discrete levels are identical to reference, including at level boundaries and halves.
+def test_discrete_matches_reference():
+	random_state = numpy.random.RandomState(0)
+	boundaries = numpy.arange(-25, 26) / 10
+	halves = numpy.arange(-45, 46, 2) / 20
+	acceleration = numpy.concatenate((boundaries, halves, -boundaries, random_state.normal(0, 1.5, 300)))
+	acceleration = acceleration[:len(acceleration) // 3 * 3].reshape(3, -1)
+
+	reference = [list(axis) for axis in reference_discrete(acceleration.tolist())]
+
+	assert sensor_samples.quantise_discrete(acceleration).tolist() == reference
+	assert sensor_samples.quantise_discrete(acceleration, True).tolist() == reference
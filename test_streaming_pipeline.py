@@ -0,0 +1,28 @@
+# imuPIN - test_streaming_pipeline.py
+# Stuart McDaniel, 2016
+
+import streaming_pipeline
+
+import numpy
+
+
+# Compressor whose partly filled windows at end of samples are given compressed samples.
+class FinalWindowsCompressor:
+	def __init__(self, compressed):
+		self.compressed = compressed
+
+	# Get compressed samples of final windows.
+	def flush(self):
+		return self.compressed
+
+
+# Peak confirmed by final partly filled windows is segmented, not lost.
+def test_finish_keeps_peak_confirmed_by_last_chunk():
+	compressed = numpy.zeros((3, 70))
+	compressed[2, 50] = 1.0
+	pipeline = streaming_pipeline.StreamingPipeline((1, 0, 0, 0))
+	pipeline.compressor = FinalWindowsCompressor(compressed)
+
+	assert pipeline.finish() == []
+	assert pipeline.peaks == [50]
+	assert pipeline.stats()["peaks"] == 1
@@ -0,0 +1,162 @@
+# imuPIN - training_store.py
+# Stuart McDaniel, 2016
+
+# Training feature store. Features are rows of one float32 array of shape (N, 3 * FEATURE_SIZE) in features file, and
+# their key transition classes are indexes into utils.DIRECTIONS in uint8 labels file. Both files are raw little-endian
+# arrays without header, so features are appended and the last feature deleted without rewriting the store, and the
+# store is loaded by memory-mapping. Store files are created by first load, append or delete, from per-direction
+# training pickles in folder if any, or by migrate_training.py.
+
+import utils
+
+import numpy
+import os
+import pickle
+
+# CONSTANTS.
+# Folder of training files.
+TRAINING_FOLDER = "training_files/"
+# Features file name.
+FEATURES_FILE = "features.f32"
+# Labels file name.
+LABELS_FILE = "labels.u8"
+# Features data type.
+FEATURE_DTYPE = numpy.dtype("<f4")
+# Labels data type.
+LABEL_DTYPE = numpy.dtype("u1")
+
+
+# Training feature store in folder. Store files are created when first used.
+class TrainingStore:
+	def __init__(self, folder=TRAINING_FOLDER):
+		self.folder = folder
+		self.features_file = os.path.join(folder, FEATURES_FILE)
+		self.labels_file = os.path.join(folder, LABELS_FILE)
+		self.feature_length = 3 * utils.FEATURE_SIZE
+
+		# Features without labels, or labels without features, cannot be used or safely recreated.
+		if os.path.isfile(self.features_file) != os.path.isfile(self.labels_file):
+			missing = self.labels_file if os.path.isfile(self.features_file) else self.features_file
+			raise FileNotFoundError("Training store file " + missing + " is missing.")
+
+	# Whether store files exist.
+	def exists(self):
+		return os.path.isfile(self.features_file) and os.path.isfile(self.labels_file)
+
+	# Number of training features.
+	def __len__(self):
+		if not self.exists():
+			return 0
+
+		# Ignore partly written last feature or label.
+		return min(os.path.getsize(self.features_file) // (self.feature_length * FEATURE_DTYPE.itemsize),
+				os.path.getsize(self.labels_file) // LABEL_DTYPE.itemsize)
+
+	# Modification time and size of store files (None for files not created).
+	def signature(self):
+		signature = []
+		for file_name in (self.features_file, self.labels_file):
+			if os.path.isfile(file_name):
+				status = os.stat(file_name)
+				signature.append((status.st_mtime_ns, status.st_size))
+			else:
+				signature.append(None)
+
+		return tuple(signature)
+
+	# Create store files from training pickles if neither exists. Nothing is overwritten, as a half-present store was
+	# rejected when opened.
+	def create(self):
+		if not os.path.isfile(self.features_file) and not os.path.isfile(self.labels_file):
+			migrate_training_pickles(self)
+
+	# Memory-map training features, array of shape (N, 3 * FEATURE_SIZE), and labels, array of shape (N,).
+	def load(self):
+		self.create()
+		size = len(self)
+		if size == 0:
+			return numpy.zeros((0, self.feature_length), dtype=FEATURE_DTYPE), numpy.zeros(0, dtype=LABEL_DTYPE)
+
+		features = numpy.memmap(self.features_file, dtype=FEATURE_DTYPE, mode="r", shape=(size, self.feature_length))
+		labels = numpy.memmap(self.labels_file, dtype=LABEL_DTYPE, mode="r", shape=(size,))
+
+		return features, labels
+
+	# Get training features and names of classes.
+	def get_training_features(self):
+		features, labels = self.load()
+
+		return features, numpy.asarray(utils.DIRECTIONS)[labels]
+
+	# Append training features, each of shape (3, FEATURE_SIZE), with names of classes.
+	def append(self, features, direction_classes):
+		features = numpy.asarray(features, dtype=FEATURE_DTYPE).reshape(-1, self.feature_length)
+		labels = numpy.array([utils.DIRECTIONS.index(direction) for direction in direction_classes], dtype=LABEL_DTYPE)
+		self.create()
+		self.truncate(len(self))
+
+		# Write features before labels, so feature without label is ignored if interrupted.
+		with open(self.features_file, "ab") as features_file:
+			features_file.write(features.tobytes())
+		with open(self.labels_file, "ab") as labels_file:
+			labels_file.write(labels.tobytes())
+
+	# Delete last training feature of class. Returns its index.
+	def delete_last(self, direction_class):
+		self.create()
+		size = len(self)
+		label = utils.DIRECTIONS.index(direction_class)
+		if size == 0:
+			raise IndexError("No training features of class " + direction_class + ".")
+
+		# Usually last feature, so only last label read.
+		index = size - 1
+		with open(self.labels_file, "rb") as labels_file:
+			labels_file.seek(index * LABEL_DTYPE.itemsize)
+			last_label = labels_file.read(LABEL_DTYPE.itemsize)
+		if last_label[0] != label:
+			matches = numpy.flatnonzero(self.load()[1] == label)
+			if len(matches) == 0:
+				raise IndexError("No training features of class " + direction_class + ".")
+			index = int(matches[-1])
+
+			# Move later features and labels back over deleted feature.
+			features = numpy.memmap(self.features_file, dtype=FEATURE_DTYPE, mode="r+",
+					shape=(size, self.feature_length))
+			labels = numpy.memmap(self.labels_file, dtype=LABEL_DTYPE, mode="r+", shape=(size,))
+			features[index:-1] = features[index + 1:]
+			labels[index:-1] = labels[index + 1:]
+			features.flush()
+			labels.flush()
+			del features, labels
+
+		self.truncate(size - 1)
+
+		return index
+
+	# Truncate store files to number of features.
+	def truncate(self, size):
+		if not self.exists():
+			return
+
+		os.truncate(self.features_file, size * self.feature_length * FEATURE_DTYPE.itemsize)
+		os.truncate(self.labels_file, size * LABEL_DTYPE.itemsize)
+
+
+# Create store from per-direction training pickles in store's folder, in order of utils.DIRECTIONS.
+# Pickles are left in place. Missing pickles are treated as having no training features.
+# Existing store is never overwritten, as it may hold training features added since pickles.
+def migrate_training_pickles(store):
+	if os.path.isfile(store.features_file) or os.path.isfile(store.labels_file):
+		raise FileExistsError("Training store already exists in " + store.folder + ".")
+
+	for file_name in (store.features_file, store.labels_file):
+		open(file_name, "xb").close()
+
+	for direction in utils.DIRECTIONS:
+		pickle_name = os.path.join(store.folder, direction + ".pkl")
+		if os.path.isfile(pickle_name):
+			with open(pickle_name, "rb") as features_file:
+				class_features = pickle.load(features_file)
+			if class_features:
+				store.append(class_features, [direction] * len(class_features))
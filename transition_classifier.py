@@ -0,0 +1,237 @@
+# imuPIN - transition_classifier.py
+# Stuart McDaniel, 2016
+
+# k-NN key transition classifier held in memory. Training features are added and deleted in place, without refitting,
+# and changes are written to training store by background thread.
+# Nearest neighbours are searched by brute force (one matrix multiplication with precomputed squared norms for Euclidean
+# distance), or with KD-tree or ball tree. Trees hold training features present when built, and features added since
+# are searched by brute force, until enough are added or a feature in tree is deleted, when tree is rebuilt.
+# Features may be projected into fewer dimensions (feature_projection) before search.
+
+import training_store
+import utils
+
+import numpy
+import queue
+import sklearn.metrics
+import sklearn.neighbors
+import threading
+
+# CONSTANTS.
+# Number of training features space is first allocated for.
+CLASSIFIER_CAPACITY = 1024
+# Key transition classes in alphabetical order, as sklearn orders classes (ties between classes go to first).
+SORTED_DIRECTIONS = sorted(utils.DIRECTIONS)
+# Column of each class in alphabetical order.
+CLASS_ORDER = numpy.array([utils.DIRECTIONS.index(direction) for direction in SORTED_DIRECTIONS])
+# Neighbour search trees by backend name.
+TREES = {"kd_tree": sklearn.neighbors.KDTree, "ball_tree": sklearn.neighbors.BallTree}
+# Number of training features in leaves of search trees.
+TREE_LEAF_SIZE = 40
+# Training features added since tree built, relative to features in tree, before tree rebuilt.
+TREE_REBUILD_FRACTION = 0.1
+
+
+# k-NN classifier of training features in training store.
+class TransitionClassifier:
+	def __init__(self, store=None, backend=None, leaf_size=TREE_LEAF_SIZE, metric="euclidean", projection=None):
+		if backend is None:
+			backend = utils.NEIGHBOUR_BACKEND
+		if backend != "brute" and backend not in TREES:
+			raise ValueError("Unknown neighbour backend " + backend + ".")
+		self.backend = backend
+		self.leaf_size = leaf_size
+		self.metric = metric
+		self.projection = projection
+		# Search tree, and number of training features in it.
+		self.tree = None
+		self.tree_size = 0
+
+		self.store = store if store is not None else training_store.TrainingStore()
+		features, labels = self.store.load()
+		# Store files' signature after last change written.
+		self.signature = self.store.signature()
+
+		# Training features as searched, their squared norms, and labels (indexes into utils.DIRECTIONS), with space to
+		# grow.
+		self.size = len(labels)
+		capacity = max(CLASSIFIER_CAPACITY, self.size)
+		features = self.prepare(features)
+		self.features = numpy.zeros((capacity, features.shape[1]), dtype=training_store.FEATURE_DTYPE)
+		self.features[:self.size] = features
+		self.norms = numpy.zeros(capacity)
+		self.norms[:self.size] = numpy.einsum("ij,ij->i", self.features[:self.size], self.features[:self.size],
+				dtype=float)
+		self.labels = numpy.zeros(capacity, dtype=training_store.LABEL_DTYPE)
+		self.labels[:self.size] = labels
+
+		# Changes waiting to be written to store.
+		self.writes = queue.Queue()
+		self.pending = 0
+		self.error = None
+		self.lock = threading.Lock()
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+	# Number of training features.
+	def __len__(self):
+		return self.size
+
+	# Add training feature of shape (3, FEATURE_SIZE) with name of class.
+	def add(self, feature, direction_class):
+		feature = numpy.asarray(feature, dtype=training_store.FEATURE_DTYPE).reshape(-1)
+		label = utils.DIRECTIONS.index(direction_class)
+
+		# Double space when full.
+		if self.size == len(self.features):
+			self.features = numpy.concatenate((self.features, numpy.zeros_like(self.features)))
+			self.norms = numpy.concatenate((self.norms, numpy.zeros_like(self.norms)))
+			self.labels = numpy.concatenate((self.labels, numpy.zeros_like(self.labels)))
+
+		self.features[self.size] = self.prepare(feature)[0]
+		self.norms[self.size] = numpy.dot(self.features[self.size], self.features[self.size].astype(float))
+		self.labels[self.size] = label
+		self.size += 1
+
+		self.write("append", feature, direction_class)
+
+	# Delete last training feature of class.
+	def remove_last(self, direction_class):
+		matches = numpy.flatnonzero(self.labels[:self.size] == utils.DIRECTIONS.index(direction_class))
+		if len(matches) == 0:
+			raise IndexError("No training features of class " + direction_class + ".")
+
+		# Move later features back over deleted feature (none if deleting last feature).
+		index = matches[-1]
+		if index < self.tree_size:
+			self.tree = None
+			self.tree_size = 0
+		self.features[index:self.size - 1] = self.features[index + 1:self.size]
+		self.norms[index:self.size - 1] = self.norms[index + 1:self.size]
+		self.labels[index:self.size - 1] = self.labels[index + 1:self.size]
+		self.size -= 1
+
+		self.write("delete", None, direction_class)
+
+	# Classify features, each of shape (3, FEATURE_SIZE), by majority of k nearest training features.
+	# Returns array of names of classes.
+	def predict(self, features, k):
+		if self.size == 0:
+			raise ValueError("No training features.")
+		k = min(k, self.size)
+		features = self.prepare(features)
+
+		neighbours = self.get_neighbours(features, k)
+
+		return vote(self.labels[neighbours])
+
+	# Flatten features, each of shape (3, FEATURE_SIZE), and project them if using projection.
+	# Returns array of shape (N, dimensions searched).
+	def prepare(self, features):
+		if self.projection is not None:
+			return self.projection.project(features)
+
+		return numpy.asarray(features, dtype=training_store.FEATURE_DTYPE).reshape(-1, 3 * utils.FEATURE_SIZE)
+
+	# Get indexes of k nearest training features of each feature, array of shape (N, k) in no particular order.
+	def get_neighbours(self, features, k):
+		if self.backend == "brute":
+			return self.get_brute_neighbours(features, k, 0)[1]
+
+		# Build tree if features in it deleted or too many added since built.
+		if self.tree is None or self.size - self.tree_size > TREE_REBUILD_FRACTION * self.tree_size:
+			self.tree = TREES[self.backend](self.features[:self.size], leaf_size=self.leaf_size, metric=self.metric)
+			self.tree_size = self.size
+		distances, neighbours = self.tree.query(features, k=min(k, self.tree_size))
+		if self.size == self.tree_size:
+			return neighbours
+
+		# Merge nearest of features added since tree built.
+		added_distances, added_neighbours = self.get_brute_neighbours(features, k, self.tree_size)
+		distances = numpy.concatenate((distances, added_distances), axis=1)
+		neighbours = numpy.concatenate((neighbours, added_neighbours), axis=1)
+		nearest = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+
+		return numpy.take_along_axis(neighbours, nearest, axis=1)
+
+	# Get distances to and indexes of k nearest training features from start of each feature, by brute force.
+	# Returns arrays of shape (N, k) in no particular order.
+	def get_brute_neighbours(self, features, k, start):
+		k = min(k, self.size - start)
+		if self.metric == "euclidean":
+			# Squared distances from each training feature (rows) to each feature (columns), using squared norms.
+			distances = self.norms[start:self.size, numpy.newaxis] - 2 * (self.features[start:self.size] @ features.T)
+			distances += numpy.einsum("ij,ij->i", features, features, dtype=float)
+			distances = numpy.sqrt(numpy.maximum(distances, 0))
+		else:
+			distances = sklearn.metrics.pairwise_distances(self.features[start:self.size], features, metric=self.metric)
+		neighbours = numpy.argpartition(distances, k - 1, axis=0)[:k].T
+
+		return numpy.take_along_axis(distances.T, neighbours, axis=1), neighbours + start
+
+	# Queue change to be written to store.
+	def write(self, operation, feature, direction_class):
+		with self.lock:
+			self.pending += 1
+		self.writes.put((operation, feature, direction_class))
+
+	# Whether all changes written to store.
+	def persisted(self):
+		with self.lock:
+			return self.pending == 0
+
+	# Wait until all changes written to store. Raises error of first failed change since last raised.
+	def flush(self):
+		self.writes.join()
+		self.raise_error()
+
+	# Write changes to store, and stop writer thread. Raises error of first failed change since last raised.
+	def close(self):
+		self.writes.put(None)
+		self.thread.join()
+		self.raise_error()
+
+	# Raise error of first failed change since last raised, if any.
+	def raise_error(self):
+		with self.lock:
+			error = self.error
+			self.error = None
+		if error is not None:
+			raise error
+
+	# Write changes to store until closed (writer thread).
+	def run(self):
+		while True:
+			change = self.writes.get()
+			if change is None:
+				self.writes.task_done()
+				break
+
+			# After failed change, signature is cleared, so classifier is seen as stale and reloaded. Writer keeps running,
+			# and error is raised by next flush or close.
+			operation, feature, direction_class = change
+			signature = None
+			try:
+				if operation == "append":
+					self.store.append([feature], [direction_class])
+				else:
+					self.store.delete_last(direction_class)
+				signature = self.store.signature()
+			except Exception as error:
+				with self.lock:
+					if self.error is None:
+						self.error = error
+			finally:
+				with self.lock:
+					self.signature = signature
+					self.pending -= 1
+				self.writes.task_done()
+
+
+# Get names of classes with most votes among labels of each feature's nearest neighbours, array of shape (N, k).
+# Ties go to alphabetically first class.
+def vote(neighbour_labels):
+	votes = numpy.zeros((len(neighbour_labels), len(utils.DIRECTIONS)), dtype=int)
+	numpy.add.at(votes, (numpy.arange(len(neighbour_labels))[:, numpy.newaxis], neighbour_labels), 1)
+
+	return numpy.asarray(SORTED_DIRECTIONS)[numpy.argmax(votes[:, CLASS_ORDER], axis=1)]
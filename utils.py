@@ -1,14 +1,27 @@
 # imuPIN - utils.py
 # Stuart McDaniel, 2016
 
+import collections
 import datetime
 import os
 
 # SYSTEM CONSTANTS.
 # Serial port name.
 SERIAL_PORT = "/dev/cu.WAX9-DCDD-COM1"
+# Capture file to replay instead of serial port, or None.
+REPLAY_FILE = os.environ.get("IMUPIN_REPLAY")
+# Capture file replay speed (1 for real time, 0 for as fast as possible), parsed by get_replay_speed when replay starts.
+REPLAY_SPEED = os.environ.get("IMUPIN_REPLAY_SPEED", "1")
 # Sample frequency of sensor in Hz.
 SAMPLE_FREQ = 100.0
+# Orientation filter engine for calibration and gravity removal ("madgwick", "mahony", or "tilt").
+ORIENTATION_FILTER = "madgwick"
+# Nearest neighbour search of transition classifier ("brute", "kd_tree", or "ball_tree").
+NEIGHBOUR_BACKEND = "brute"
+# Number of dimensions features projected into before nearest neighbour search (None for no projection).
+PROJECTION_DIMENSIONS = None
+# Distance transition classifier finds nearest training features by ("euclidean", or "dtw" for dynamic time warping).
+TRANSITION_DISTANCE = "euclidean"
 # Number of samples in sliding window.
 WINDOW_SIZE = 5
 # Number of samples sliding window slides.
@@ -26,6 +39,19 @@ KEYPAD = (1, 0), (0, 3), (1, 3), (2, 3), (0, 2), (1, 2), (2, 2), (0, 1), (1, 1),
 DIRECTIONS = ["L", "R", "D", "U", "LD", "LU", "RD", "RU", "S"]
 
 
+# Get capture file replay speed from REPLAY_SPEED.
+def get_replay_speed():
+	try:
+		speed = float(REPLAY_SPEED)
+	except ValueError:
+		speed = -1.0
+	if not speed >= 0:
+		raise ValueError("Replay speed IMUPIN_REPLAY_SPEED must be a number at least 0, not " + repr(REPLAY_SPEED) +
+				".")
+
+	return speed
+
+
 # Create and open folder to save sensor data in.
 def create_folder():
 	os.chdir("sensor_data")
@@ -36,10 +62,54 @@ def create_folder():
 
 # Calculate if values in lists within certain range of each other.
 def list_within_range(lists, range_value):
-	for i in range(len(lists[0]) - 1):
-		for j in range(i + 1, len(lists[0])):
-			if abs(lists[0][i] - lists[0][j]) > range_value or abs(lists[1][i] - lists[1][j]) > range_value or \
-					abs(lists[2][i] - lists[2][j]) > range_value:
-				return False
+	for values in lists[:3]:
+		if len(values) and max(values) - min(values) > range_value:
+			return False
 
 	return True
+
+
+# Streaming detector of whether last window of samples on every axis are within certain range of each other.
+# Keeps running minimum and maximum of window on each axis with monotonic deques, so each sample takes constant
+# amortised time regardless of window size.
+class StationarityDetector:
+	def __init__(self, window, range_value, axes=3):
+		self.window = window
+		self.range_value = range_value
+		self.count = 0
+		# Deques of (sample number, value) with increasing values (minimum first) and decreasing values (maximum first).
+		self.minimums = [collections.deque() for i in range(axes)]
+		self.maximums = [collections.deque() for i in range(axes)]
+
+	# Add sample values on each axis. Returns whether last window of samples within range.
+	def update(self, values):
+		oldest = self.count - self.window + 1
+		stationary = self.count >= self.window - 1
+
+		for minimums, maximums, value in zip(self.minimums, self.maximums, values):
+			# Remove values that can no longer be window minimum or maximum.
+			while minimums and minimums[-1][1] >= value:
+				minimums.pop()
+			minimums.append((self.count, value))
+			while maximums and maximums[-1][1] <= value:
+				maximums.pop()
+			maximums.append((self.count, value))
+
+			# Remove values outside window.
+			if minimums[0][0] < oldest:
+				minimums.popleft()
+			if maximums[0][0] < oldest:
+				maximums.popleft()
+
+			if maximums[0][1] - minimums[0][1] > self.range_value:
+				stationary = False
+
+		self.count += 1
+
+		return stationary
+
+	# Clear samples.
+	def reset(self):
+		self.count = 0
+		for deque in self.minimums + self.maximums:
+			deque.clear()